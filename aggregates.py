@@ -0,0 +1,196 @@
+"""Every per-window total the sections chart, from one query.
+
+``compute`` reads the ``engineering_daily`` rollup once per date window,
+grouped at the finest grain any section needs (project code, project, task,
+person), and derives the per-project, per-code, per-source, per-type,
+per-task and per-person totals from that frame in one go. Sections memoize
+the result in the ``DataCache`` by window, so it is recomputed once per
+data version and the charts only slice it. When the columnar snapshot
+(snapshot.py) is current, the same grouping runs on the mapped Arrow file
+instead of SQLite.
+
+Project totals are kept sorted by hours with their running sum, so a
+threshold slider resolves to "the top k projects plus Other" with a binary
+search, and figures can be cached by k rather than by the exact threshold.
+
+``drill`` narrows the totals to the codes under an equipment, subset,
+product, code, source, type or project: the codes come from an index over
+their decoded components and the rows from the cube's positions per code,
+so a drill step never goes back to the database.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import queries
+import snapshot
+from code_validator import HIERARCHY, build_code_index, decode_codes
+from dates import ALL_TIME
+from instrumentation import timed
+from queries import CURRENT_AFFAIRS, run_query
+
+CUBE_KEYS = ['project_code', 'project_name', 'task_name', 'person_name']
+_cube = text("""
+    SELECT project_code, project_name, task_name, person_name, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE date BETWEEN :start AND :end
+    GROUP BY project_code, project_name, task_name, person_name
+""")
+
+
+# What a drill-down can narrow on, in the order selections are keyed
+DRILL_LEVELS = HIERARCHY + ['map_source_str', 'map_tp_str', 'project_name']
+# Drill states kept per Aggregates
+MAX_DRILLED = 32
+
+
+def _totals(cube, keys, value='duration'):
+    """Hours per ``keys``, sorted by key like the ``ORDER BY`` of the SQL queries."""
+    totals = cube.groupby(keys, sort=True)['duration'].sum().reset_index()
+    return totals.rename(columns={'duration': value})
+
+
+class Aggregates:
+    """Totals for one date window; treat the frames as read-only."""
+
+    def __init__(self, cube, drilled_codes=None):
+        self.cube = cube
+        # The project codes these totals were narrowed to, or None
+        self.drilled_codes = drilled_codes
+        self._index = None
+        self._rows = None
+        self._drilled = {}
+        projects = cube[cube['project_name'] != CURRENT_AFFAIRS]
+
+        # Ascending by name, as queries.project_hours returns them
+        self.project_hours = _totals(projects, 'project_name', 'total_hours')
+        # Descending by hours; ``_cumulative[k]`` is the total of the first k
+        self._ranked = self.project_hours.sort_values('total_hours', ascending=False, kind='stable',
+                                                      ignore_index=True)
+        self._cumulative = np.concatenate([[0.0], self._ranked['total_hours'].cumsum().to_numpy()])
+        # The same hours ascending, for searchsorted
+        self._ascending = self._ranked['total_hours'].to_numpy()[::-1]
+
+        self.code_hours = _totals(cube, 'project_code')
+        self._product_hours = _totals(projects, ['project_code', 'project_name'])
+        self._task_hours = _totals(cube, ['project_name', 'task_name']).set_index('project_name')
+        self._person_hours = _totals(cube, ['person_name', 'project_name']).set_index('person_name')
+
+        decoded = decode_codes(self.code_hours['project_code'])
+        by_code = self.code_hours.join(decoded[['map_source_str', 'map_tp_str']])
+        source_duration = _totals(by_code, 'map_source_str', 'total_duration')
+        self.source_duration = source_duration[source_duration['map_source_str'] != CURRENT_AFFAIRS]
+        self.type_duration = _totals(by_code, 'map_tp_str', 'total_duration')
+        by_project_code = _totals(projects, 'project_code')
+        by_project_code = by_project_code.join(decode_codes(by_project_code['project_code'])[['product']])
+        self.product_duration = _totals(by_project_code, 'product', 'total_duration')
+
+    @property
+    def empty(self):
+        return self.cube.empty
+
+    @property
+    def ranked(self):
+        """Project totals, largest first."""
+        return self._ranked
+
+    @property
+    def cumulative(self):
+        """Running hours of ``ranked``, with a leading 0: ``cumulative[k]`` is the top k's total."""
+        return self._cumulative
+
+    def cut(self, threshold):
+        """How many projects have at least ``threshold`` hours, in O(log n)."""
+        return len(self._ascending) - int(np.searchsorted(self._ascending, threshold, side='left'))
+
+    def split_other(self, threshold):
+        """Projects with at least ``threshold`` hours, largest first, plus the rest summed as "Other"."""
+        return self.top(self.cut(threshold))
+
+    def top(self, kept):
+        """The ``kept`` largest projects plus the rest summed as "Other", ranked by hours."""
+        other_total = self._cumulative[-1] - self._cumulative[kept]
+        # "Other" goes where its total ranks among the kept projects
+        position = min(kept, self.cut(other_total))
+        other = pd.DataFrame({'project_name': ['Other'], 'total_hours': [other_total]})
+        return pd.concat([self._ranked.iloc[:position], other, self._ranked.iloc[position:kept]],
+                         ignore_index=True)
+
+    @property
+    def code_index(self):
+        """``build_code_index`` of the window's codes, plus the codes of each project name."""
+        if self._index is None:
+            index = build_code_index(self.code_hours['project_code'])
+            codes = self.cube.groupby('project_name', sort=False)['project_code'].unique()
+            index['project_name'] = {name: frozenset(found) for name, found in codes.items()}
+            self._index = index
+        return self._index
+
+    def codes(self, selection):
+        """The codes matching every ``(level, value)`` pair of ``selection``; None for no selection."""
+        found = None
+        for level, value in selection:
+            codes = self.code_index[level].get(value, frozenset())
+            found = codes if found is None else found & codes
+        return found
+
+    def options(self, level, selection):
+        """The values of ``level`` that the rest of ``selection`` leaves, sorted."""
+        others = self.codes(tuple(item for item in selection if item[0] != level))
+        return sorted(value for value, codes in self.code_index[level].items() if others is None or codes & others)
+
+    def drill(self, selection):
+        """These totals narrowed to the codes matching ``selection``, a tuple of ``(level, value)`` pairs."""
+        if not selection:
+            return self
+        drilled = self._drilled.get(selection)
+        if drilled is None:
+            if self._rows is None:
+                self._rows = self.cube.groupby('project_code', sort=False).indices
+            codes = self.codes(selection)
+            positions = [self._rows[code] for code in codes if code in self._rows]
+            positions = np.sort(np.concatenate(positions)) if positions else np.array([], dtype=np.intp)
+            if len(self._drilled) >= MAX_DRILLED:
+                self._drilled.clear()
+            drilled = self._drilled[selection] = Aggregates(self.cube.iloc[positions].reset_index(drop=True),
+                                                            tuple(sorted(codes)))
+        return drilled
+
+    def product_code_hours(self, codes):
+        rows = self._product_hours[self._product_hours['project_code'].isin(codes)]
+        return rows.groupby('project_code', sort=True)['duration'].sum().reset_index()
+
+    def product_project_hours(self, codes):
+        rows = self._product_hours[self._product_hours['project_code'].isin(codes)]
+        return rows.groupby('project_name', sort=True)['duration'].sum().reset_index()
+
+    def task_hours(self, project_name):
+        return self._slice(self._task_hours, project_name)
+
+    def person_project_hours(self, person_name):
+        return self._slice(self._person_hours, person_name)
+
+    @staticmethod
+    def _slice(totals, key):
+        if key not in totals.index:
+            return totals.iloc[:0].reset_index(drop=True)
+        return totals.loc[[key]].reset_index(drop=True)
+
+
+@timed('aggregate')
+def compute(start=ALL_TIME[0], end=ALL_TIME[1]):
+    """The ``Aggregates`` for the Jalali (start, end) window."""
+    table = snapshot.table()
+    if table is not None:
+        return Aggregates(snapshot.group_hours(table, CUBE_KEYS, start, end))
+    return Aggregates(run_query(_cube, start=start, end=end))
+
+
+@timed('aggregate')
+def daily_project_hours(start=ALL_TIME[0], end=ALL_TIME[1], codes=None):
+    """Hours per day and project outside current affairs, narrowed to ``codes`` (a drill-down) unless None."""
+    table = snapshot.table()
+    if table is None:
+        return queries.daily_project_hours(start, end, codes)
+    daily = snapshot.group_hours(table, ['date', 'project_name'], start, end, codes)
+    return daily[daily['project_name'] != CURRENT_AFFAIRS].reset_index(drop=True)
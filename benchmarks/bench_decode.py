@@ -0,0 +1,57 @@
+"""Compare the per-row ``decode_code2`` path with the batch ``decode_codes``.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_decode
+    python -m benchmarks.bench_decode --rows 100000 1000000 --codes 200
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from benchmarks.generator import random_codes
+from code_validator import decode_code2, decode_codes
+
+
+def apply_path(codes):
+    # The original visualizer.py code
+    df = pd.DataFrame({'project_code': codes})
+    decoded_results = df['project_code'].apply(decode_code2)
+    df['decoded'], df['map_source_str'], df['map_tp_str'] = zip(*decoded_results)
+    return df
+
+
+def batch_path(codes):
+    return decode_codes(codes)
+
+
+def best_of(func, arg, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--codes', type=int, default=100, help="distinct project codes in the column")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    distinct = random_codes(args.codes)
+    rng = random.Random(1)
+    for rows in args.rows:
+        codes = pd.Series(rng.choices(distinct, k=rows))
+        apply_time = best_of(apply_path, codes, args.repeat)
+        batch_time = best_of(batch_path, codes, args.repeat)
+        print(f"{rows:>10,} rows  apply: {apply_time:8.3f}s  decode_codes: {batch_time:8.3f}s  "
+              f"speedup: {apply_time / batch_time:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
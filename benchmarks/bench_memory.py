@@ -0,0 +1,118 @@
+"""Memory of the dashboard's data paths against a plain ``SELECT *`` frame.
+
+The dashboard never holds the whole table as a frame: the Arrow snapshot is
+written in chunks (snapshot.py) and mapped, and the totals are grouped on
+the mapped file. Copies the engineering rows into a temporary database
+until it holds the requested number of rows, then reports the peak
+resident memory of each step, and the bytes per million rows of the
+``SELECT *`` frame for comparison::
+
+    python -m benchmarks.bench_memory --rows 1000000
+"""
+import argparse
+import multiprocessing
+import shutil
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import aggregates
+import database
+import migrate
+import snapshot
+from instrumentation import _rss_bytes
+
+
+def grow_copy(source, target, rows):
+    shutil.copyfile(source, target)
+    conn = sqlite3.connect(target)
+    columns = "person_name, task_name, project_code, project_name, date, duration, project_description"
+    while conn.execute("SELECT COUNT(*) FROM engineering").fetchone()[0] < rows:
+        conn.execute(f"INSERT INTO engineering ({columns}) SELECT {columns} FROM engineering")
+    conn.execute("DELETE FROM engineering WHERE id > (SELECT id FROM engineering ORDER BY id LIMIT 1 OFFSET ?)",
+                 (rows - 1,))
+    conn.commit()
+    conn.close()
+
+
+def megabytes_per_million(df):
+    return df.memory_usage(deep=True).sum() / 2 ** 20 / (len(df) / 1_000_000)
+
+
+def peak_rss(load, interval=0.005):
+    """``load()`` and the most its call added to the resident set, in bytes, sampled every ``interval``."""
+    baseline = peak = _rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, _rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        result = load()
+    finally:
+        done.set()
+        sampler.join()
+    return result, max(peak, _rss_bytes()) - baseline
+
+
+def select_all():
+    return pd.read_sql("SELECT * FROM engineering", database.engine)
+
+
+def write_snapshot():
+    snapshot.write()
+    return snapshot.open_snapshot(snapshot.snapshot_path())[0]
+
+
+def all_time_totals():
+    return aggregates.compute().cube
+
+
+# (label, load, prepare); ``prepare`` runs first and is not measured
+LOADERS = [
+    ("SELECT * (object dtypes)", select_all, None),
+    ("snapshot write", write_snapshot, None),
+    ("all-time totals (snapshot)", all_time_totals, lambda: snapshot.refresh(background=False)),
+]
+
+
+def measure(path, number):
+    # Runs in a fresh process, so memory freed by an earlier step cannot hide this one's peak
+    database.use_database(path)
+    _, load, prepare = LOADERS[number]
+    if prepare is not None:
+        prepare()
+    result, peak = peak_rss(load)
+    # Only the SELECT * result is a frame of the whole table
+    per_million = megabytes_per_million(result) if load is select_all and len(result) else None
+    return len(result), per_million, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "engineering.db"
+        grow_copy(database.db_path, path, args.rows)
+        # The snapshot's stamp reads the edit counter
+        migrate.upgrade(path)
+
+        context = multiprocessing.get_context('spawn')
+        for number, (label, _, _) in enumerate(LOADERS):
+            with context.Pool(1) as pool:
+                rows, per_million, peak = pool.apply(measure, (path, number))
+            size = f"{per_million:8.1f} MB per million rows" if per_million is not None else f"{'':26}"
+            print(f"{label:<28} {rows:>10,} rows  {size}  peak +{peak / 2 ** 20:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
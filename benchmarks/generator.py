@@ -0,0 +1,143 @@
+"""Seeded synthetic timesheet databases for the benchmarks.
+
+Project codes are valid combinations from the taxonomy in taxonomy.json and
+project names are their ``decode_code`` names, as the data-entry side stores
+them. About 40% of the hours go to current affairs
+(code ``000000000``), like the real table::
+
+    python -m benchmarks.generator synthetic.db --rows 1000000 --seed 0
+"""
+import argparse
+import datetime
+import random
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+import taxonomy
+from code_validator import decode_code
+from dates import to_jalali
+
+CURRENT_AFFAIRS_CODE = "000000000"
+CURRENT_AFFAIRS = "امور جاری"
+
+FIRST_NAMES = ["حسن", "حسین", "حسینعلی", "لعیا", "محمدرضا", "علی", "مریم", "زهرا", "رضا", "سارا",
+               "مهدی", "فاطمه", "امیر", "نرگس", "سعید", "الهام"]
+LAST_NAMES = ["حیدری", "جمالی", "شیخ", "حسن نژاد", "روحی", "احمدی", "کریمی", "رضایی", "موسوی",
+              "محمدی", "صادقی", "نوری"]
+TASKS = ["طراحی دستگاه", "طراحی ماشین", "جلسات", "پیگیری امور جاری", "تهیه اسناد  BOM", "یدکی اصلاحی",
+         "طراحی فیکسچر", "طراحی قالب", "آموزش", "تهیه اسناد  Drawing", "طراحی ابزار", "تحویل فایل و نقشه",
+         "طراحی محصول", "مطالعه و تحقیق", "چک کردن نقشه و فایل", "محاسبه هزینه", "زمان سنجی",
+         "کارشناسی طراحی و ساخت", "برون سپاری", "اتوماسیون", "آرشیو اسناد"]
+DESCRIPTIONS = ["تهیه BOM", "اصلاح نقشه و فایل", "پیگیری ساخت", "جلسه با تولید", "بررسی یدکی اصلاحی",
+                "طراحی و پرینت قطعه", "تحویل نقشه ها و زمانسنجی", "ارسال نامه اتوماسیون", ""]
+# Durations are logged in half hours; short entries are the most common
+DURATIONS = np.array([0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 6.0, 7.5, 8.0])
+DURATION_WEIGHTS = np.array([20, 24, 10, 18, 4, 7, 2, 3, 2, 2, 4], dtype=float)
+
+SCHEMA = """
+CREATE TABLE engineering (
+    id INTEGER NOT NULL,
+    person_name VARCHAR,
+    task_name VARCHAR,
+    project_code VARCHAR,
+    project_name VARCHAR,
+    date DATE,
+    duration FLOAT,
+    project_description VARCHAR,
+    PRIMARY KEY (id)
+)
+"""
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+
+
+def random_codes(count, seed=0):
+    """``count`` distinct valid project codes, the first being current affairs."""
+    rng = random.Random(seed)
+    tax = taxonomy.current()
+    codes = [CURRENT_AFFAIRS_CODE]
+    seen = set(codes)
+    while len(codes) < count:
+        equipment = rng.choice([key for key, subsets in tax.subsets.items() if subsets])
+        subset = rng.choice(list(tax.subsets[equipment]))
+        code = (equipment + subset + rng.choice(list(tax.products)) + rng.choice(list(tax.sources))
+                + rng.choice(list(tax.types)) + f"{rng.randint(1, 99):02d}")
+        if code not in seen:
+            seen.add(code)
+            codes.append(code)
+    return codes
+
+
+def people(count, seed=0):
+    rng = random.Random(seed)
+    names = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+    return rng.sample(names, min(count, len(names)))
+
+
+def _zipf_weights(count, rng):
+    # A few projects and people account for most of the hours
+    weights = 1 / np.arange(1, count + 1) ** 0.9
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def generate(path, rows, seed=0, codes=None, persons=None, years=3, batch=200_000):
+    """Create ``path`` with an ``engineering`` table of ``rows`` synthetic entries."""
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    rng = np.random.default_rng(seed)
+    codes = codes or max(50, min(5_000, rows // 200))
+    persons = persons or max(5, min(150, rows // 2_000))
+    code_list = random_codes(codes, seed)
+    names = {code: CURRENT_AFFAIRS if code == CURRENT_AFFAIRS_CODE else decode_code(code) for code in code_list}
+    person_list = people(persons, seed)
+
+    code_weights = _zipf_weights(len(code_list), rng)
+    code_weights[0] = 0
+    code_weights = 0.6 * code_weights / code_weights.sum()
+    code_weights[0] = 0.4
+    person_weights = _zipf_weights(len(person_list), rng)
+    duration_weights = DURATION_WEIGHTS / DURATION_WEIGHTS.sum()
+
+    last_day = datetime.date(2024, 9, 8)
+    days = [to_jalali(last_day - datetime.timedelta(days=offset)) for offset in range(365 * years)]
+
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    for start in range(0, rows, batch):
+        size = min(batch, rows - start)
+        chosen_codes = np.array(code_list, dtype=object)[rng.choice(len(code_list), size, p=code_weights)]
+        chunk = zip(
+            np.array(person_list, dtype=object)[rng.choice(len(person_list), size, p=person_weights)],
+            np.array(TASKS, dtype=object)[rng.integers(len(TASKS), size=size)],
+            chosen_codes,
+            [names[code] for code in chosen_codes],
+            np.array(days, dtype=object)[rng.integers(len(days), size=size)],
+            rng.choice(DURATIONS, size, p=duration_weights).tolist(),
+            np.array(DESCRIPTIONS, dtype=object)[rng.integers(len(DESCRIPTIONS), size=size)],
+        )
+        conn.executemany(
+            "INSERT INTO engineering (person_name, task_name, project_code, project_name, date, duration, "
+            "project_description) VALUES (?, ?, ?, ?, ?, ?, ?)", chunk)
+        conn.commit()
+    conn.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic engineering_dashboard database")
+    parser.add_argument('output')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.output, args.rows, args.seed)
+    print(f"wrote {args.rows} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
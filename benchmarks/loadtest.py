@@ -0,0 +1,259 @@
+"""Load test: concurrent simulated sessions against one dashboard process.
+
+Each simulated user is a Streamlit ``AppTest`` of visualizer.py with an
+authenticated session of its own, running in its own thread, so the
+sessions share the process-wide caches, the precompute worker and the GIL
+the way the sessions of one ``streamlit run`` server do. After a first page load every user makes a
+random, seeded mix of the changes people make: switching sections, moving
+the "minimum hours" slider, changing the period, bucket, project, person
+or drill-down. Every rerun is timed; for each concurrency level the report
+has the throughput, p50/p95/p99 rerun latency and the process's memory::
+
+    python -m benchmarks.loadtest                            # 100k rows; 1, 2, 4 and 8 users
+    python -m benchmarks.loadtest --size 1M --users 1 4 16 --actions 30 --output load.json
+
+The database comes from the same generator (and ``--data-dir``) as
+benchmarks.run. Each level runs in a fresh process, warmed up by one
+untimed session that opens every section, so no level starts with the
+results a previous level left in the caches. The users' reruns overlap:
+AppTest would install and clear a process-wide runtime around every rerun,
+so it is pointed at a private copy and one runtime serves all users. AppTest
+reruns the whole script where the browser would rerun a single fragment,
+so the latencies are an upper bound.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import database
+import dates
+from benchmarks.generator import SIZES
+from benchmarks.run import ROOT, metadata, prepare
+from instrumentation import _rss_bytes
+
+APP = ROOT.parent / 'visualizer.py'
+USERNAME = 'loadtest'
+RERUN_TIMEOUT = 120
+
+
+def _choose(rng, options, current=None):
+    others = [option for option in options if option != current]
+    return rng.choice(others or list(options))
+
+
+def switch_section(at, rng):
+    section = at.radio(key='section')
+    section.set_value(_choose(rng, section.options, section.value))
+
+
+def change_period(at, rng):
+    # A custom range needs a date picker round trip; the presets cover the same queries
+    period = at.selectbox(key='period')
+    period.set_value(_choose(rng, [preset for preset in dates.PRESETS if preset != "Custom range"], period.value))
+
+
+def change_bucket(at, rng):
+    bucket = at.radio(key='bucket')
+    bucket.set_value(_choose(rng, bucket.options, bucket.value))
+
+
+def move_threshold(at, rng):
+    sliders = [slider for slider in at.slider if slider.key == 'threshold']
+    if not sliders:
+        return switch_section(at, rng)
+    sliders[0].set_value(rng.uniform(sliders[0].min, sliders[0].max))
+
+
+def _pick(at, rng, label):
+    boxes = [box for box in at.selectbox if box.label == label]
+    if not boxes or not boxes[0].options:
+        return switch_section(at, rng)
+    boxes[0].set_value(_choose(rng, boxes[0].options, boxes[0].value))
+
+
+def pick_project(at, rng):
+    _pick(at, rng, "Select Project Code")
+
+
+def pick_person(at, rng):
+    _pick(at, rng, "Select Person")
+
+
+def drill(at, rng):
+    source = at.selectbox(key='drill_map_source_str')
+    source.set_value(_choose(rng, source.options, source.value))
+
+
+# (weight, action); an action whose widget is not on the page switches section instead
+ACTIONS = [
+    (4, switch_section),
+    (3, move_threshold),
+    (2, change_period),
+    (1, change_bucket),
+    (2, pick_project),
+    (2, pick_person),
+    (1, drill),
+]
+
+
+def login(at):
+    at.session_state['authentication_status'] = True
+    at.session_state['name'] = USERNAME
+    at.session_state['username'] = USERNAME
+    at.session_state['logout'] = None
+
+
+def share_runtime():
+    """Let the AppTests of one process rerun at the same time.
+
+    AppTest sets ``Runtime._instance`` to a mock before each run and to None
+    after it, which would take the runtime away from the other users'
+    reruns. Its module is given a subclass to set and clear instead, and
+    one mock like AppTest's is installed for everyone. It also compiles the
+    script for every run, which is not safe to do in parallel on every
+    Python version; the users share one script cache, as in a server.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    app_test.Runtime = type('Runtime', (Runtime,), {'_instance': None})
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    Runtime._instance = runtime
+    # AppTest patches this option around each run; overlapping patches could
+    # restore the unpatched value under another user's rerun
+    config.set_option('global.appTest', True)
+
+
+def timed_run(at, samples, errors):
+    start = time.perf_counter()
+    at.run(timeout=RERUN_TIMEOUT)
+    samples.append(time.perf_counter() - start)
+    errors.extend(exception.value for exception in at.exception)
+
+
+def session(user, actions, seed, first_loads, reruns, errors):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed * 1_000 + user)
+    at = AppTest.from_file(str(APP), default_timeout=RERUN_TIMEOUT)
+    login(at)
+    timed_run(at, first_loads, errors)
+    weights, functions = zip(*ACTIONS)
+    for _ in range(actions):
+        rng.choices(functions, weights)[0](at, rng)
+        timed_run(at, reruns, errors)
+
+
+def warm_up():
+    """One untimed session opening every section, as a server that has been up a while."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APP), default_timeout=RERUN_TIMEOUT)
+    login(at)
+    at.run()
+    for section in at.radio(key='section').options:
+        at.radio(key='section').set_value(section)
+        at.run()
+
+
+def run_level(path, users, actions, seed):
+    # Runs in a fresh process, so the caches hold only what the warm-up left
+    database.use_database(path)
+    share_runtime()
+    warm_up()
+    first_loads, reruns, errors = [], [], []
+    threads = [threading.Thread(target=session, args=(user, actions, seed, first_loads, reruns, errors))
+               for user in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(reruns) * 1000
+    p50, p95, p99 = map(float, np.percentile(latencies, [50, 95, 99])) if len(latencies) else (None,) * 3
+    return {
+        'users': users,
+        'reruns': len(reruns) + len(first_loads),
+        'seconds': elapsed,
+        'throughput': (len(reruns) + len(first_loads)) / elapsed,
+        'first_load_ms': float(np.median(first_loads)) * 1000 if first_loads else None,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'rss_mb': _rss_bytes() / 2 ** 20,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'errors': len(errors),
+        'error_examples': sorted(set(map(str, errors)))[:5],
+    }
+
+
+def _ms(value):
+    # No reruns after the first load (--actions 0) leave no percentiles
+    return f"{'-':>9}" if value is None else f"{value:>7.0f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with concurrent simulated sessions")
+    parser.add_argument('--size', default='100k', choices=list(SIZES))
+    parser.add_argument('--users', nargs='+', type=int, default=[1, 2, 4, 8], help="concurrency levels")
+    parser.add_argument('--actions', type=int, default=20, help="widget changes per user after the first load")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', type=Path, default=ROOT / 'data')
+    parser.add_argument('--output', type=Path, default=ROOT / 'loadtest.json')
+    args = parser.parse_args()
+
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+    prepare(args.size, SIZES[args.size], args.data_dir, args.seed)
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        # Read when the app first imports credentials, so set before any session starts
+        os.environ['ENG_VIS_CREDENTIALS'] = str(Path(directory) / 'credentials.json')
+        Path(os.environ['ENG_VIS_CREDENTIALS']).write_text(json.dumps(
+            {'users': {USERNAME: {'name': USERNAME, 'password': ''}}}))
+
+        print(f"{'users':>5} {'reruns':>7} {'per s':>7} {'first':>9} {'p50':>9} {'p95':>9} {'p99':>9} "
+              f"{'rss':>8} {'errors':>6}")
+        levels = []
+        for users in args.users:
+            with context.Pool(1) as pool:
+                level = pool.apply(run_level, (database.db_path, users, args.actions, args.seed))
+            levels.append(level)
+            print(f"{users:>5} {level['reruns']:>7} {level['throughput']:>7.2f} {_ms(level['first_load_ms'])} "
+                  f"{_ms(level['p50_ms'])} {_ms(level['p95_ms'])} {_ms(level['p99_ms'])} "
+                  f"{level['rss_mb']:>6.0f}MB {level['errors']:>6}", flush=True)
+
+    report = {'meta': {**metadata(args), 'size': args.size, 'actions': args.actions},
+              'max_rss_mb': max(level['max_rss_mb'] for level in levels), 'levels': levels}
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Reproducible dashboard benchmarks against synthetic databases.
+
+For each size a seeded database is generated (and kept in ``--data-dir`` for
+the next run), migrated and rolled up. Then each stage is timed: loading the
+rows (a plain ``SELECT *`` for comparison, and writing and mapping the
+columnar snapshot the dashboard reads), decoding codes, every section's
+aggregation and every figure's construction and serialization. Results go
+to JSON so releases can be compared::
+
+    python -m benchmarks.run                          # 10k, 100k and 1M rows
+    python -m benchmarks.run --sizes 10k 100k 1M 10M --output release.json
+    python -m benchmarks.run --compare previous.json  # also print the ratios
+"""
+import argparse
+import datetime
+import json
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import plotly
+import sqlalchemy
+
+import aggregates
+import database
+import figures
+import migrate
+import queries
+import rollups
+from benchmarks.bench_decode import apply_path
+from benchmarks.generator import SIZES, generate
+from code_validator import build_product_index, decode_codes, validate_codes
+from dates import ALL_TIME, from_jalali, to_jalali
+from snapshot import group_hours, load as load_snapshot, open_snapshot, snapshot_path, write as write_snapshot
+
+ROOT = Path(__file__).parent
+
+
+def measure(func, repeat):
+    """Best wall time over ``repeat`` runs, then one traced run for the peak Python heap."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    del result
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, min(timings), peak
+
+
+def stages(rows):
+    """The ``(name, func)`` pairs to time, in dashboard order."""
+    columnar_path = snapshot_path()
+    write_snapshot(path=columnar_path)
+    columnar, _ = open_snapshot(columnar_path)
+    frame = load_snapshot(['project_code', 'project_name', 'person_name', 'date'], columnar_path)
+    top_project = frame['project_name'].value_counts().index[0]
+    top_person = frame['person_name'].value_counts().index[0]
+    product_index = build_product_index(queries.project_codes())
+    top_product = max(product_index, key=lambda product: len(product_index[product]['codes']))
+    product_codes = tuple(sorted(product_index[top_product]['codes']))
+    month = from_jalali(frame['date'][frame['date'] != ''].max()) - datetime.timedelta(days=30)
+    last_month = (to_jalali(month), ALL_TIME[1])
+
+    totals = aggregates.compute()
+    daily_hours = queries.daily_project_hours()
+    threshold = totals.project_hours['total_hours'].median()
+
+    yield 'load.select_star', lambda: pd.read_sql("SELECT * FROM engineering", database.engine)
+    yield 'load.snapshot_write', lambda: write_snapshot(path=columnar_path)
+    yield 'load.snapshot_open', lambda: open_snapshot(columnar_path)
+    yield 'decode.decode_codes', lambda: decode_codes(frame['project_code'])
+    yield 'decode.validate_codes', lambda: validate_codes(frame['project_code'])
+    if rows <= 1_000_000:
+        yield 'decode.apply', lambda: apply_path(frame['project_code'].astype(object))
+
+    yield 'aggregate.project_hours', queries.project_hours
+    yield 'aggregate.project_hours_last_month', lambda: queries.project_hours(*last_month)
+    yield 'aggregate.daily_project_hours', queries.daily_project_hours
+    yield 'aggregate.code_hours', queries.code_hours
+    yield 'aggregate.engine', aggregates.compute
+    yield 'aggregate.engine_last_month', lambda: aggregates.compute(*last_month)
+    yield 'aggregate.engine_snapshot', lambda: aggregates.Aggregates(
+        group_hours(columnar, aggregates.CUBE_KEYS))
+    yield 'aggregate.split_other', lambda: totals.split_other(threshold)
+    yield 'aggregate.product_index', lambda: build_product_index(queries.project_codes())
+    yield 'aggregate.product_code_hours', lambda: queries.product_code_hours(product_codes)
+    yield 'aggregate.product_project_hours', lambda: queries.product_project_hours(product_codes)
+    yield 'aggregate.task_hours', lambda: queries.task_hours(top_project)
+    yield 'aggregate.person_project_hours', lambda: queries.person_project_hours(top_person)
+    yield 'aggregate.person_entries_page', lambda: queries.entries_page((('person_name', top_person),))
+
+    yield 'figure.project_hours_bar', lambda: figures.project_hours_bar(totals.split_other(threshold))
+    yield 'figure.project_time_series', lambda: figures.project_time_series(daily_hours, 'month')
+    yield 'figure.project_code_pie', lambda: figures.project_code_pie(totals.split_other(threshold))
+    yield 'figure.source_pie', lambda: figures.source_pie(totals.source_duration)
+    yield 'figure.type_pie', lambda: figures.type_pie(totals.type_duration)
+    yield 'figure.product_project_bar', lambda: figures.product_project_bar(
+        totals.product_project_hours(product_codes), top_product)
+    yield 'figure.task_bar', lambda: figures.task_bar(totals.task_hours(top_project))
+    yield 'figure.person_project_bar', lambda: figures.person_project_bar(
+        totals.person_project_hours(top_person), top_person)
+
+
+def prepare(label, rows, data_dir, seed):
+    path = data_dir / f"engineering_{label}_seed{seed}.db"
+    timings = {}
+    if not path.exists():
+        start = time.perf_counter()
+        generate(path, rows, seed)
+        timings['setup.generate'] = time.perf_counter() - start
+    database.use_database(path)
+    start = time.perf_counter()
+    migrate.upgrade()
+    timings['setup.migrate'] = time.perf_counter() - start
+    start = time.perf_counter()
+    rollups.rebuild()
+    timings['setup.rollup_rebuild'] = time.perf_counter() - start
+    return timings
+
+
+def run_size(label, rows, args):
+    results = []
+    for stage, seconds in prepare(label, rows, args.data_dir, args.seed).items():
+        results.append({'rows': rows, 'stage': stage, 'seconds': seconds})
+    for stage, func in stages(rows):
+        result, seconds, peak = measure(func, args.repeat)
+        record = {'rows': rows, 'stage': stage, 'seconds': seconds, 'peak_mb': peak / 2 ** 20}
+        if stage.startswith('figure.'):
+            # Serialization is what Streamlit pays to send the figure to the browser
+            start = time.perf_counter()
+            payload = result.to_json()
+            record['serialize_seconds'] = time.perf_counter() - start
+            record['payload_bytes'] = len(payload.encode())
+        elif hasattr(result, '__len__'):
+            record['result_rows'] = len(result)
+        results.append(record)
+        print(f"{label:>5} {stage:<40} {seconds * 1000:10.2f} ms  {peak / 2 ** 20:8.1f} MB", flush=True)
+    return results
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=ROOT).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'seed': args.seed,
+        'repeat': getattr(args, 'repeat', None),
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+        'plotly': plotly.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, previous_path):
+    previous = {(record['rows'], record['stage']): record['seconds']
+                for record in json.loads(Path(previous_path).read_text())['results']}
+    print(f"\n{'rows':>10} {'stage':<40} {'before':>10} {'after':>10} {'ratio':>7}")
+    for record in results:
+        before = previous.get((record['rows'], record['stage']))
+        if before:
+            print(f"{record['rows']:>10} {record['stage']:<40} {before * 1000:8.2f}ms "
+                  f"{record['seconds'] * 1000:8.2f}ms {record['seconds'] / before:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard against synthetic databases")
+    parser.add_argument('--sizes', nargs='+', default=['10k', '100k', '1M'], choices=list(SIZES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', type=Path, default=ROOT / 'data')
+    parser.add_argument('--output', type=Path, default=ROOT / 'results.json')
+    parser.add_argument('--compare', help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for label in args.sizes:
+        results.extend(run_size(label, SIZES[label], args))
+    # ru_maxrss is in KiB on Linux
+    report = {'meta': metadata(args), 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+              'results': results}
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
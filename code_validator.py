@@ -1,235 +1,77 @@
-import re
+import numpy as np
+import pandas as pd
 import streamlit as st
 
-equipment_name = {
-    'D': 'قالب ریخته گری',
-    'C': 'قالب ماهیچه',
-    'F': 'فیکسچر',
-    'G': 'گیج',
-    'M': 'ماشین آلات',
-    'T': 'ابزار براده برداری',
-    'V': 'متفرقه',
-    'Q': 'متفرقه خارج از شرکت',
-    'R': 'کارخانه آلیاژ سازی'
-}
-
-equipment_name_subset = {
-    'D': {
-        '10': 'LPDC',
-        '11': 'DC (Gravity)',
-        '12': 'TILT',
-        '13': 'HPDC'
-    },
-    'C': {
-        '10': 'واترجکت',
-        '11': 'اویل جکت',
-        '12': 'پورت دود',
-        '13': 'پورت هوا',
-        '14': 'پورت دود و هوا',
-        '15': 'میل بادامک',
-        '16': 'شمع',
-        '17': 'TOP CORE',
-        '18': 'کانال وسط',
-        '19': 'میل بادامک و کانال',
-        '20': 'رایزر کور'
-    },
-    'F': {
-        '10': 'شیفت عرضی',
-        '11': 'شیفت طولی',
-        '12': 'كنترل اندازه محفظه',
-        '13': 'حكاكي شماره زني',
-        '14': 'برش اره',
-        '15': 'سیت و گاید',
-        '16': 'حكاكي لیزر',
-        '51': 'ماشینکاری op10',
-        '52': 'ماشینکاری op20',
-        '53': 'ماشینکاری op50',
-        '54': 'ماشینکاری OP30',
-        '55': 'ماشینکاری OP40',
-        '71': 'کلمپ های هیدرولیک چکشی',
-        '72': 'کلمپ های هیدرولیک گردشی',
-        '73': 'فیکسچر ماشینکاری کیوب',
-        '74': 'فیکسچر درپوش',
-        '75': 'فیکسچر محفظه',
-        '76': 'فیکسچر منیفولد',
-        '77': 'فیکسچر جانبی',
-        '78': 'فیکسچر شمع',
-        '79': 'فیکسچر استکانی',
-        '80': 'فیکسچر ماشینکاری لانگبورینگ',
-        '81': 'فیکسچرهای ماشین هکرت',
-    },
-    'G': {
-        '10': ' موقعيت كپه',
-        '11': 'منيفولد دود',
-        '12': 'منيفولد هوا',
-        '13': ' لنگي و سيت و گايد',
-        '14': 'میز صافی سطح',
-        '15': 'مولتی کنترلی استکانی'
-
-    },
-    'M': {
-
-        '11': 'ریخته گری DC',
-        '12': 'ریخته گری TILT',
-        '13': 'واترجکت',
-        '14': 'اویل جکت',
-        '15': 'پورت دود',
-        '16': 'پورت هوا',
-        '17': 'پورت دود و هوا',
-        '18': 'میل بادامک',
-        '19': 'شمع',
-        '20': 'کانال وسط',
-        '21': 'ماشین کاری',
-        '22': 'مخصوص',
-        '23': 'تست راکروم',
-        '24': 'سواخ آب',
-        '25': 'لوپرژر',
-        '26': 'کوره ذوب',
-        '27': 'کاراسلی',
-        '28': 'شات بلاست',
-        '29': 'دکورینگ',
-        '30': 'کوره عملیات حرارتی',
-        '31': 'کوره بازیافت',
-        '32': 'دستگاه هم زن',
-        '33': 'دستگاه سرند',
-        '34': 'tx3000',
-        '35': 'دستگاه تست کاسه نمد',
-        '36': 'کفتراش',
-        '37': 'دستگاه کیوب',
-        '38': 'ماشین ماهیچه افقی',
-        '39': 'ماشین ماهیچه عمودی',
-        '40': 'فاتا',
-        '41': 'کوره پخت',
-        '42': 'میز ویبره',
-        '43': 'دستگاه سیت و گاید سمت دود',
-        '44': 'دستگاه سیت و گاید سمت هوا',
-        '45': 'نوار نقاله کوره بازیافت',
-        '46': 'همزن مذاب(MTS)',
-        '47': 'بالابر ماسه(Elevator)',
-        '48': 'ماشین ماهیچه کلد باکس',
-        '49': 'ماشین تست لیک',
-        '50': 'گونیا',
-        '51': 'قلاویز',
-        '52': 'ماشین آسیاب',
-        '53': 'تراش QC'
-    },
-    'T': {
-        '10': 'هلدر',
-        '11': 'چکش بادی',
-        '12': 'مولتی 10 محوره'
-    },
-    'V': {
-        '10': 'مدل قطعه دیوایدر',
-        '11': 'مدل مخروطی',
-        '12': 'مدل لاست فوم',
-        '30': 'طراحی مکانیزم',
-        '31': 'عمومی',
-        '32': 'فرز',
-        '33': 'باکس رنگ',
-        '34': 'لیفتراک',
-        '35': 'نمونه کشش',
-        '36': 'اره',
-        '37': 'جانمایی دستگاه ها',
-        '38': 'پرینتر 3بعدی',
-        '39': 'قالب توری کاپی',
-        '40': 'مدل سازی 3بعدی',
-        '41': 'جرثقیل',
-        '42': 'مدل سازی تفلونی',
-        '43': "توری گذار"
-    },
-    'Q': {
-        '10': "اهدا دارو"
-    },
-    'R': {
-        '10': 'کوره آلیاژ سازی  5تن',
-        '11': 'کوره آلیاژ سازی  10تن',
-        '12': 'کوره ذوب براده',
-        '13': 'دستگاه استریر',
-        '14': 'دستگاه خشک کن براده',
-        '15': 'دستگاه شمش ریزی',
-        '16': 'دستگاه مگنت',
-    }
-
-}
-
-product_name = {
-    '10': 'EC5',
-    '11': 'IP20-I',
-    '12': 'IP20-II',
-    '13': 'K4',
-    '14': 'ATV',
-    '15': 'کپه یاتاقان 5و1',
-    '16': 'ME16',
-    '17': 'IK3',
-    '18': 'پژو گرویتی',
-    '19': 'پیکان',
-    '20': 'پراید',
-    '21': 'نیسان',
-    '23': 'پژو LPDC',
-    '24': 'EF7',
-    '25': 'TU5',
-    '26': 'پژوپارتنر',
-    '27': 'کاماز',
-    '28': 'M15',
-    '29': 'فیات تمپرا',
-    '30': 'مسترسیلندر سمند',
-    '31': 'مسترسیلندر 206',
-    '32': 'ME15',
-    '33': 'کپه یاتاقان 3و3',
-    '38': 'S81',
-    '42': 'کپه یاتاقان 2و4',
-    '44': 'E4',
-    '55': 'کپه یاتاقان 5و5',
-    '57': 'TU3',
-    '90': 'عمومی',
-    '91': 'ربات',
-    '92': 'قطعه گیر',
-    '98': 'کوره',
-    '99': 'متفرقه',
-}
-
-map_source = {
-    'N': 'داخلی',
-    'X': 'خارجی',
-}
-
-map_type = {
-    'P': 'پروژه',
-    'S': 'یدکی اصلاحی',
-    'R': 'تحقیقاتی',
-}
+import taxonomy
+from instrumentation import timed
+
+# Reasons reported by code_reason / validate_codes
+OK = 'ok'
+CURRENT_AFFAIRS_CODE = 'current_affairs'
+MISSING = 'missing'
+BAD_LENGTH = 'bad_length'
+UNKNOWN_EQUIPMENT = 'unknown_equipment'
+UNKNOWN_SUBSET = 'unknown_subset'
+UNKNOWN_PRODUCT = 'unknown_product'
+UNKNOWN_SOURCE = 'unknown_source'
+UNKNOWN_TYPE = 'unknown_type'
+BAD_NUMBER = 'bad_number'
+REASONS = [OK, CURRENT_AFFAIRS_CODE, MISSING, BAD_LENGTH, UNKNOWN_EQUIPMENT, UNKNOWN_SUBSET, UNKNOWN_PRODUCT,
+           UNKNOWN_SOURCE, UNKNOWN_TYPE, BAD_NUMBER]
+
+def code_reason(code, tax=None):
+    """Why ``code`` is invalid, or ``OK``. The length is checked before slicing."""
+    tax = tax or taxonomy.current()
+    if not isinstance(code, str):
+        return MISSING
+    if code == "000000000":
+        return CURRENT_AFFAIRS_CODE
+    if len(code) != 9:
+        return BAD_LENGTH
+    if code[:1] not in tax.equipment:
+        return UNKNOWN_EQUIPMENT
+    if code[:3] not in tax.equipment_subsets:
+        return UNKNOWN_SUBSET
+    if code[3:5] not in tax.products:
+        return UNKNOWN_PRODUCT
+    if code[5] not in tax.sources:
+        return UNKNOWN_SOURCE
+    if code[6] not in tax.types:
+        return UNKNOWN_TYPE
+    number = code[7:]
+    if not number.isdigit() or not 1 <= int(number) <= 99:
+        return BAD_NUMBER
+    return OK
 
 
 def validate_code(code):
-    # Extract components from the code
-    equipment, subset, product, map_src, map_tp, number = code[:1], code[1:3], code[3:5], code[5], code[6], code[7:]
+    return code_reason(code) == OK
 
-    if len(code) != 9:
-        return False
-    # Check if each component is valid
-    elif equipment not in equipment_name:
-        return False
-    elif subset not in equipment_name_subset.get(equipment, {}):
-        return False
-    elif product not in product_name:
-        return False
-    elif map_src not in map_source:
-        return False
-    elif map_tp not in map_type:
-        return False
-    elif not number.isdigit() or not 1 <= int(number) <= 99:
-        return False
-
-    return True
-
-
-def decode_code(code):
+
+@timed('decode')
+def validate_codes(codes):
+    """Validate a column of codes, checking each distinct code once.
+
+    Returns a frame with the input's index and ``valid`` (bool) and
+    ``reason`` (categorical, one of ``REASONS``) columns.
+    """
+    tax = taxonomy.current()
+    codes = pd.Series(codes)
+    positions, uniques = pd.factorize(codes)
+    reason_positions = np.array([REASONS.index(code_reason(code, tax)) for code in uniques]
+                                + [REASONS.index(MISSING)], dtype=np.int8)
+    reasons = pd.Categorical.from_codes(reason_positions[positions], REASONS)
+    return pd.DataFrame({'valid': reasons == OK, 'reason': reasons}, index=codes.index)
+
+
+def decode_code(code, tax=None):
+    tax = tax or taxonomy.current()
     code = code.upper()
     equipment, subset, product, map_src, map_tp, number = code[:1], code[1:3], code[3:5], code[5], code[6], code[7:]
     # Provide a default message if the key is not found
-    equipment_name_str = equipment_name.get(equipment)
-    equipment_subset_str = equipment_name_subset.get(equipment, {}).get(subset)
-    product_name_str = product_name.get(product)
+    equipment_name_str = tax.equipment.get(equipment)
+    equipment_subset_str = tax.subsets.get(equipment, {}).get(subset)
+    product_name_str = tax.products.get(product)
     if code == "000000000":
         return "امور جاری"
     else:
@@ -240,17 +82,18 @@ def decode_code(code):
                 )
 
 
-def decode_code2(code,ret_product=False):
+def decode_code2(code,ret_product=False, tax=None):
 
+    tax = tax or taxonomy.current()
     code = code.upper()
-    equipment, subset, product, map_src, map_tp, number = code[:1], code[1:3], code[3:5], code[5], code[6], code[7:]
+    equipment, subset, product, map_src, map_tp, number = code[:1], code[1:3], code[3:5], code[5:6], code[6:7], code[7:]
 
     # Provide a default message if the key is not found
-    equipment_name_str = equipment_name.get(equipment, "Unknown Equipment")
-    equipment_subset_str = equipment_name_subset.get(equipment, {}).get(subset, "Unknown Subset")
-    product_name_str = product_name.get(product, "Unknown Product")
-    map_source_str = map_source.get(map_src, "Unknown Source")
-    map_tp_str = map_type.get(map_tp, "Unknown Type")
+    equipment_name_str = tax.equipment.get(equipment, "Unknown Equipment")
+    equipment_subset_str = tax.subsets.get(equipment, {}).get(subset, "Unknown Subset")
+    product_name_str = tax.products.get(product, "Unknown Product")
+    map_source_str = tax.sources.get(map_src, "Unknown Source")
+    map_tp_str = tax.types.get(map_tp, "Unknown Type")
     if ret_product:
         return product_name_str
     if code == "000000000":
@@ -263,4 +106,137 @@ def decode_code2(code,ret_product=False):
                           map_tp_str + " " +
                           "دست " + number
                           )
-        return decoded_string, map_source_str, map_tp_str
\ No newline at end of file
+        return decoded_string, map_source_str, map_tp_str
+
+
+DECODED_COLUMNS = ['decoded', 'map_source_str', 'map_tp_str', 'product', 'equipment', 'subset']
+
+# Decoded parts per distinct code, for the taxonomy version in _parts_version
+_parts_cache = {}
+_parts_version = None
+
+
+def _decode_parts(code, tax):
+    global _parts_cache, _parts_version
+    if tax.version != _parts_version:
+        # A reloaded taxonomy makes every cached name stale
+        _parts_cache, _parts_version = {}, tax.version
+    parts = _parts_cache.get(code)
+    if parts is None:
+        decoded_string, map_source_str, map_tp_str = decode_code2(code, tax=tax)
+        upper = code.upper()
+        equipment, subset, product = upper[:1], upper[1:3], upper[3:5]
+        if upper == "000000000":
+            # Current affairs, labelled like its source and type rather than
+            # as an unknown product, equipment and subset
+            parts = (decoded_string, map_source_str, map_tp_str) + (map_source_str,) * 3
+        else:
+            parts = (decoded_string, map_source_str, map_tp_str,
+                     tax.products.get(product, "Unknown Product"),
+                     tax.equipment.get(equipment, "Unknown Equipment"),
+                     tax.subsets.get(equipment, {}).get(subset, "Unknown Subset"))
+        _parts_cache[code] = parts
+    return parts
+
+
+@timed('decode')
+def decode_codes(codes):
+    """Decode a column of project codes into categorical columns.
+
+    Every distinct code is decoded once and the results are broadcast back
+    to the rows, so the cost depends on the number of distinct codes rather
+    than on the number of timesheet entries. Missing codes decode to NaN.
+    Decoded codes are remembered until the taxonomy is reloaded.
+    """
+    tax = taxonomy.current()
+    codes = pd.Series(codes)
+    positions, uniques = pd.factorize(codes)
+    decoded = pd.DataFrame([_decode_parts(code, tax) for code in uniques], columns=DECODED_COLUMNS)
+
+    result = {}
+    for column in DECODED_COLUMNS:
+        category_positions, categories = pd.factorize(decoded[column])
+        # The trailing -1 sends missing codes (position -1) to a missing category
+        lookup = np.append(category_positions, -1)
+        result[column] = pd.Categorical.from_codes(lookup[positions], categories)
+    return pd.DataFrame(result, index=codes.index)
+
+
+@timed('decode')
+def build_product_index(codes):
+    """Map each product name to the project codes using it.
+
+    ``codes`` may repeat (e.g. a column of rows); each distinct code is
+    decoded once. Returns ``{product: {'codes': set_of_codes}}``; codes
+    without a product are left out.
+    """
+    tax = taxonomy.current()
+    index = {}
+    for code in pd.Series(codes, dtype=object).dropna().unique():
+        product = _decode_parts(code, tax)[3]
+        if product is not None:
+            index.setdefault(product, {'codes': set()})['codes'].add(code)
+    return index
+
+
+# Levels of the code hierarchy, outermost first
+HIERARCHY = ['equipment', 'subset', 'product', 'project_code']
+
+
+@timed('decode')
+def build_code_index(codes):
+    """Map every decoded component to the set of codes carrying it.
+
+    Returns ``{level: {value: frozenset_of_codes}}`` for the ``HIERARCHY``
+    levels (each code maps to itself) and for ``map_source_str`` and
+    ``map_tp_str``. Narrowing to several components is the intersection of
+    their sets.
+    """
+    tax = taxonomy.current()
+    index = {level: {} for level in HIERARCHY + ['map_source_str', 'map_tp_str']}
+    for code in pd.unique(pd.Series(codes).dropna()):
+        _, map_source_str, map_tp_str, product, equipment, subset = _decode_parts(code, tax)
+        for level, value in (('equipment', equipment), ('subset', subset), ('product', product),
+                             ('project_code', code), ('map_source_str', map_source_str),
+                             ('map_tp_str', map_tp_str)):
+            index[level].setdefault(value, set()).add(code)
+    return {level: {value: frozenset(found) for value, found in values.items()} for level, values in index.items()}
+
+
+def audit(codes):
+    """Summarize a column of codes: rows per reason and the invalid codes with their row counts."""
+    result = validate_codes(codes).assign(code=pd.Series(codes).to_numpy())
+    summary = result['reason'].value_counts().reindex(REASONS, fill_value=0)
+    bad = result[~result['valid'] & (result['reason'] != CURRENT_AFFAIRS_CODE)]
+    bad_codes = (bad.groupby(['code', 'reason'], observed=True, dropna=False).size()
+                 .rename('rows').reset_index().sort_values('rows', ascending=False))
+    return summary, bad_codes
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Audit project codes for validity")
+    parser.add_argument('--file', help="CSV/text file of codes instead of the engineering table")
+    parser.add_argument('--column', default='project_code', help="column to read from a CSV file")
+    parser.add_argument('--output', help="write the invalid codes to this CSV file")
+    args = parser.parse_args()
+
+    if args.file:
+        codes = pd.read_csv(args.file, usecols=[args.column], dtype=str, keep_default_na=False)[args.column]
+    else:
+        import database
+
+        with database.Session() as session:
+            codes = pd.read_sql("SELECT project_code FROM engineering", session.bind)['project_code']
+
+    summary, bad_codes = audit(codes)
+    print(summary.to_string())
+    print()
+    print(bad_codes.to_string(index=False) if len(bad_codes) else "no invalid codes")
+    if args.output:
+        bad_codes.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
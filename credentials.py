@@ -0,0 +1,168 @@
+"""Dashboard logins, kept as bcrypt hashes in a JSON file.
+
+The store (``credentials.json`` or ``ENG_VIS_CREDENTIALS``) maps each
+username to a display name and a password hash::
+
+    {"users": {"hosseini": {"name": "hosseini", "password": "$2b$12$..."}}}
+
+``current()`` reads it once per process and again only when its mtime or
+size changes. Users are added or changed one at a time, so only their
+passwords are hashed; bcrypt runs in a thread pool, where it releases the
+GIL, and the file is replaced atomically::
+
+    python credentials.py set hosseini --name "Hosseini"   # prompts for the password
+    python credentials.py remove seydi
+    python credentials.py list
+
+When the store does not exist yet it is created from the older
+``hashed_pw.pkl`` and the account list in generate_keys.py.
+"""
+import argparse
+import getpass
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import bcrypt
+
+CREDENTIALS_PATH = Path(os.environ.get("ENG_VIS_CREDENTIALS", Path(__file__).parent / "credentials.json"))
+LEGACY_PICKLE = Path(__file__).parent / "hashed_pw.pkl"
+HASH_WORKERS = int(os.environ.get("ENG_VIS_HASH_WORKERS", 4))
+
+_lock = threading.Lock()
+_executor = None
+_cache = {}
+
+
+class Credentials(NamedTuple):
+    # Parallel tuples, in the order streamlit_authenticator.Authenticate takes them
+    names: tuple
+    usernames: tuple
+    passwords: tuple
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(HASH_WORKERS, thread_name_prefix='bcrypt')
+    return _executor
+
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+
+def hash_passwords(passwords):
+    """Hash ``passwords`` concurrently in the bcrypt pool, keeping their order."""
+    return list(_pool().map(hash_password, passwords))
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)['users']
+
+
+def _write(path, users):
+    path = Path(path)
+    # Written next to the store and renamed over it, so readers never see half a file
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            json.dump({'users': users}, file, ensure_ascii=False, indent=4)
+        os.chmod(temporary, 0o600)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _import_legacy(path):
+    from generate_keys import staff_names, usernames
+
+    with LEGACY_PICKLE.open('rb') as file:
+        hashed_passwords = pickle.load(file)
+    _write(path, {username: {'name': name, 'password': password}
+                  for name, username, password in zip(staff_names, usernames, hashed_passwords)})
+
+
+def users(path=CREDENTIALS_PATH):
+    """``{username: {'name': ..., 'password': hash}}`` as stored, creating the store if needed."""
+    path = Path(path)
+    if not path.exists() and LEGACY_PICKLE.exists():
+        _import_legacy(path)
+    return _read(path)
+
+
+def current(path=CREDENTIALS_PATH):
+    """The stored ``Credentials``, re-read only when the file has changed."""
+    path = Path(path)
+    with _lock:
+        if not path.exists() and LEGACY_PICKLE.exists():
+            _import_legacy(path)
+        stat = path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = _cache.get(path)
+        if cached is None or cached[0] != stamp:
+            stored = _read(path)
+            cached = _cache[path] = (stamp, Credentials(
+                tuple(user['name'] for user in stored.values()), tuple(stored),
+                tuple(user['password'] for user in stored.values())))
+        return cached[1]
+
+
+def set_users(changes, path=CREDENTIALS_PATH):
+    """Add or update users from ``{username: (name, password)}``, hashing only their passwords."""
+    stored = users(path) if Path(path).exists() or LEGACY_PICKLE.exists() else {}
+    hashed = hash_passwords([password for _, password in changes.values()])
+    for (username, (name, _)), password in zip(changes.items(), hashed):
+        stored[username] = {'name': name, 'password': password}
+    _write(path, stored)
+
+
+def remove_user(username, path=CREDENTIALS_PATH):
+    stored = users(path)
+    if stored.pop(username, None) is None:
+        raise KeyError(username)
+    _write(path, stored)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the dashboard logins")
+    parser.add_argument('--store', type=Path, default=CREDENTIALS_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    set_parser = commands.add_parser('set', help="add a user or change their name or password")
+    set_parser.add_argument('username')
+    set_parser.add_argument('--name', help="display name; defaults to the current one, or the username")
+    set_parser.add_argument('--password-stdin', action='store_true', help="read the password from stdin")
+    remove_parser = commands.add_parser('remove', help="remove a user")
+    remove_parser.add_argument('username')
+    commands.add_parser('list', help="list the users")
+    args = parser.parse_args()
+
+    if args.command == 'set':
+        existing = users(args.store).get(args.username, {}) if args.store.exists() else {}
+        name = args.name or existing.get('name') or args.username
+        password = sys.stdin.readline().rstrip('\n') if args.password_stdin else getpass.getpass()
+        if not password:
+            parser.error("empty password")
+        set_users({args.username: (name, password)}, args.store)
+        print(f"{'updated' if existing else 'added'} {args.username}")
+    elif args.command == 'remove':
+        try:
+            remove_user(args.username, args.store)
+        except KeyError:
+            parser.error(f"no such user: {args.username}")
+        print(f"removed {args.username}")
+    else:
+        for username, user in users(args.store).items():
+            print(f"{username}\t{user['name']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import taxonomy
+
+# Database setup
+db_path = Path(os.environ.get("ENG_VIS_DB", Path(__file__).parent / "engineering_dashboard.db"))
+engine = create_engine(f'sqlite:///{db_path}')
+Session = sessionmaker(bind=engine)
+
+# Seconds cached results may be served before they are recomputed even if the
+# database reports no change.
+CACHE_TTL = float(os.environ.get("ENG_VIS_CACHE_TTL", 300))
+# Most results (query frames, figures) kept per version
+CACHE_MAX_RESULTS = int(os.environ.get("ENG_VIS_CACHE_MAX_RESULTS", 512))
+
+# Rows read as Python objects at a time when the Arrow snapshot is written
+# (snapshot.py); this, not the table size, sets the peak memory of a write
+LOAD_CHUNKSIZE = 20_000
+
+
+def use_database(path):
+    """Point ``engine`` and ``Session`` at another database file, e.g. a synthetic one."""
+    global db_path, engine
+    db_path = Path(path)
+    engine = create_engine(f'sqlite:///{db_path}')
+    Session.configure(bind=engine)
+
+
+class DataCache:
+    """Process-wide cache of what the sections compute from the ``engineering`` table.
+
+    Query results and figures are reused until the TTL expires or SQLite
+    reports that another connection has committed a change (``PRAGMA
+    data_version``). Each such change bumps ``version``, as does a reload of
+    the code taxonomy. The rows themselves are not held here: totals come
+    from the daily rollup or the mapped Arrow snapshot, and raw entries are
+    read a page at a time. ``on_change(path)`` runs before every new version is taken
+    (the data moved, the taxonomy was reloaded or the TTL ran out), so
+    anything derived from the data, e.g. the rollup and the Arrow snapshot,
+    is brought up to date before results are computed for that version, and
+    its own writes belong to it rather than starting another one.
+
+    Results computed elsewhere, e.g. by the precompute worker, come in
+    through ``publish``; the last published result per key outlives the
+    version it was computed for, so ``lookup`` can still serve it.
+    """
+
+    def __init__(self, path=None, ttl=CACHE_TTL, max_results=CACHE_MAX_RESULTS, on_change=None):
+        self.on_change = on_change
+        self.path = path or db_path
+        self.ttl = ttl
+        self.max_results = max_results
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self.loaded_at = None
+        self._data_version = None
+        self._taxonomy_version = None
+        self._results = OrderedDict()
+        self._published = OrderedDict()
+        self._lock = threading.RLock()
+        # data_version is per connection, so the probe needs one that stays open
+        self._probe = sqlite3.connect(str(self.path), check_same_thread=False)
+
+    def _current_data_version(self):
+        return self._probe.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check(self):
+        data_version = self._current_data_version()
+        taxonomy_version = taxonomy.current().version
+        expired = self.loaded_at is None or time.time() - self.loaded_at > self.ttl
+        if self.on_change is not None and (expired or data_version != self._data_version
+                                           or taxonomy_version != self._taxonomy_version):
+            self.on_change(self.path)
+            data_version = self._current_data_version()
+        if expired or data_version != self._data_version:
+            self._results = OrderedDict()
+            self._data_version = data_version
+            self.loaded_at = time.time()
+            self.version += 1
+        if taxonomy_version != self._taxonomy_version:
+            # Cached results may hold decoded names
+            if self._taxonomy_version is not None:
+                self._results = OrderedDict()
+                self.version += 1
+            self._taxonomy_version = taxonomy_version
+
+    def cached(self, key, compute):
+        """Return ``compute()`` memoized under ``key`` for the current version.
+
+        The least recently used results are dropped past ``max_results``.
+        """
+        with self._lock:
+            self._check()
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+            self.misses += 1
+            result = self._results[key] = compute()
+            if len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            return result
+
+    def publish(self, key, result, version):
+        """Store a ``result`` computed for ``version``; it is served as current only if that is still current."""
+        with self._lock:
+            self._published[key] = result
+            self._published.move_to_end(key)
+            if len(self._published) > self.max_results:
+                self._published.popitem(last=False)
+            if version == self.version:
+                self._results[key] = result
+                if len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+
+    def lookup(self, key):
+        """``(result, True)`` when ``key`` is cached for the current version, else the last published result
+        (None if there is none) and False."""
+        with self._lock:
+            self._check()
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return self._results[key], True
+            return self._published.get(key), False
+
+    def current_version(self):
+        with self._lock:
+            self._check()
+            return self.version
+
+    def memo(self, func, *args):
+        """Return ``func(*args)``, e.g. an aggregate query, once per version."""
+        return self.cached(self.memo_key(func, *args), lambda: func(*args))
+
+    @staticmethod
+    def memo_key(func, *args):
+        # Qualified by module: rollups.refresh and snapshot.refresh share a name
+        return ('memo', func.__module__, func.__qualname__) + args
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded_at = None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'version': self.version,
+            'cached_results': len(self._results),
+            'published_results': len(self._published),
+            'age_seconds': None if self.loaded_at is None else round(time.time() - self.loaded_at, 1),
+            'ttl_seconds': self.ttl,
+        }
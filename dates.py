@@ -0,0 +1,124 @@
+"""Jalali date helpers for the date-range filter.
+
+Dates are stored in ``engineering.date`` as zero-padded Jalali strings
+(``1403-06-18``), so ranges can be compared as plain strings and use the
+``date`` indexes directly.
+"""
+import datetime
+
+import pandas as pd
+
+PRESETS = ["All time", "This week", "This month", "This quarter", "Custom range"]
+BUCKETS = ["day", "week", "month"]
+
+# Bounds that match every stored date; used when no range is selected
+ALL_TIME = ("0000-00-00", "9999-99-99")
+
+
+def gregorian_to_jalali(gy, gm, gd):
+    g_d_m = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+    gy2 = gy + 1 if gm > 2 else gy
+    days = 355666 + (365 * gy) + ((gy2 + 3) // 4) - ((gy2 + 99) // 100) + ((gy2 + 399) // 400) + gd + g_d_m[gm - 1]
+    jy = -1595 + (33 * (days // 12053))
+    days %= 12053
+    jy += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        jy += (days - 1) // 365
+        days = (days - 1) % 365
+    if days < 186:
+        jm, jd = 1 + days // 31, 1 + days % 31
+    else:
+        jm, jd = 7 + (days - 186) // 30, 1 + (days - 186) % 30
+    return jy, jm, jd
+
+
+def jalali_to_gregorian(jy, jm, jd):
+    jy += 1595
+    days = -355668 + (365 * jy) + ((jy // 33) * 8) + (((jy % 33) + 3) // 4) + jd
+    days += (jm - 1) * 31 if jm < 7 else ((jm - 7) * 30) + 186
+    gy = 400 * (days // 146097)
+    days %= 146097
+    if days > 36524:
+        days -= 1
+        gy += 100 * (days // 36524)
+        days %= 36524
+        if days >= 365:
+            days += 1
+    gy += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        gy += (days - 1) // 365
+        days = (days - 1) % 365
+    gd = days + 1
+    leap = (gy % 4 == 0 and gy % 100 != 0) or gy % 400 == 0
+    month_days = [31, 29 if leap else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    gm = 0
+    while gd > month_days[gm]:
+        gd -= month_days[gm]
+        gm += 1
+    return gy, gm + 1, gd
+
+
+def to_jalali(date):
+    """``datetime.date`` -> ``'1403-06-18'``."""
+    return "%04d-%02d-%02d" % gregorian_to_jalali(date.year, date.month, date.day)
+
+
+def from_jalali(value):
+    """``'1403-06-18'`` -> ``datetime.date``."""
+    jy, jm, jd = (int(part) for part in value.split("-"))
+    return datetime.date(*jalali_to_gregorian(jy, jm, jd))
+
+
+def week_start(date):
+    # The Iranian week starts on Saturday (weekday 5)
+    return date - datetime.timedelta(days=(date.weekday() - 5) % 7)
+
+
+def preset_range(preset, today=None, custom=None):
+    """Return the ``(start, end)`` Jalali strings for a preset.
+
+    ``custom`` is a pair of ``datetime.date`` used by "Custom range". Ends
+    use day 31 for months, which is past the last day of every Jalali
+    month and so still compares correctly as a string.
+    """
+    today = today or datetime.date.today()
+    jy, jm, _ = gregorian_to_jalali(today.year, today.month, today.day)
+    if preset == "This week":
+        start = week_start(today)
+        return to_jalali(start), to_jalali(start + datetime.timedelta(days=6))
+    if preset == "This month":
+        return f"{jy:04d}-{jm:02d}-01", f"{jy:04d}-{jm:02d}-31"
+    if preset == "This quarter":
+        first = 3 * ((jm - 1) // 3) + 1
+        return f"{jy:04d}-{first:02d}-01", f"{jy:04d}-{first + 2:02d}-31"
+    if preset == "Custom range" and custom:
+        start, end = custom
+        return to_jalali(start), to_jalali(end)
+    return ALL_TIME
+
+
+def bucket_label(value, bucket):
+    """Label of the day/week/month bucket a Jalali date string falls in."""
+    if bucket == "month":
+        return value[:7]
+    if bucket == "week":
+        return to_jalali(week_start(from_jalali(value)))
+    return value
+
+
+def bucket_labels(values, bucket):
+    """Vectorised ``bucket_label`` over a Series; each distinct date is converted once."""
+    return values.map({value: bucket_label(value, bucket) for value in values.unique()})
+
+
+def jalali_to_datetime(values):
+    """Series of Jalali strings -> datetime64 Series; unparseable values become NaT."""
+    mapping = {}
+    for value in pd.unique(values):
+        try:
+            mapping[value] = from_jalali(value)
+        except (AttributeError, TypeError, ValueError):
+            mapping[value] = None
+    return pd.to_datetime(values.map(mapping))
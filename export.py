@@ -0,0 +1,119 @@
+"""Streaming CSV/Parquet export of raw timesheet entries.
+
+Rows are written chunk by chunk as they come out of the database, so the
+full result is never held in memory::
+
+    python export.py entries.csv --person "حسن حیدری"
+    python export.py entries.parquet --project "..." --start 1403-05-01 --end 1403-05-31
+"""
+import argparse
+import itertools
+import shlex
+
+import pandas as pd
+
+import queries
+from dates import ALL_TIME
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+FORMATS = ['csv', 'parquet']
+# Entry filters the command line can express, by column
+_OPTIONS = {'person_name': '--person', 'project_name': '--project', 'project_code': '--code'}
+
+
+def write_csv(chunks, target, columns=tuple(queries.ENTRY_COLUMNS)):
+    """Write DataFrame chunks to a path or text file object; returns the row count."""
+    rows = 0
+    # An empty result still gets its header row
+    empty = pd.DataFrame(columns=[column for column in queries.ENTRY_COLUMNS if column in columns])
+    for number, chunk in enumerate(itertools.chain(chunks, [empty])):
+        if number and chunk is empty:
+            break
+        # The BOM lets Excel detect UTF-8 (Persian text) when opening the file
+        chunk.to_csv(target, mode='w' if number == 0 else 'a', header=number == 0, index=False,
+                     encoding='utf-8-sig' if number == 0 else 'utf-8')
+        rows += len(chunk)
+    return rows
+
+
+def _parquet_schema(columns):
+    return pa.schema([(column, pa.float64() if column == 'duration' else pa.string()) for column in columns])
+
+
+def write_parquet(chunks, target, columns=tuple(queries.ENTRY_COLUMNS)):
+    """Write DataFrame chunks as row groups of one Parquet file; returns the row count."""
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    rows = 0
+    # A fixed schema, so a first chunk full of NULLs cannot set the column types
+    schema = _parquet_schema([column for column in queries.ENTRY_COLUMNS if column in columns])
+    with pq.ParquetWriter(target, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+
+def export_entries(target, fmt='csv', filters=(), columns=tuple(queries.ENTRY_COLUMNS), start=ALL_TIME[0],
+                   end=ALL_TIME[1], exclude_current_affairs=False, chunksize=50_000):
+    chunks = queries.iter_entries(filters, columns, chunksize, start, end, exclude_current_affairs)
+    if fmt == 'parquet':
+        return write_parquet(chunks, target, columns)
+    return write_csv(chunks, target, columns)
+
+
+def command(output, filters=(), start=ALL_TIME[0], end=ALL_TIME[1], exclude_current_affairs=False):
+    """The ``python export.py`` command line that exports the entries matching ``filters``."""
+    args = ['python', 'export.py', output]
+    codes = None
+    for column, value in filters:
+        if column == 'project_code':
+            # Several code filters all have to match
+            value = set(value) if isinstance(value, tuple) else {value}
+            codes = value if codes is None else codes & value
+        else:
+            args += [_OPTIONS[column], value]
+    for code in sorted(codes or ()):
+        args += ['--code', code]
+    if start != ALL_TIME[0]:
+        args += ['--start', start]
+    if end != ALL_TIME[1]:
+        args += ['--end', end]
+    if exclude_current_affairs:
+        args.append('--exclude-current-affairs')
+    return shlex.join(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export engineering entries to CSV or Parquet")
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=FORMATS, help="default: from the output file extension")
+    parser.add_argument('--person')
+    parser.add_argument('--project')
+    parser.add_argument('--code', action='append', help="project code; may be repeated")
+    parser.add_argument('--start', default=ALL_TIME[0], help="first Jalali date, e.g. 1403-05-01")
+    parser.add_argument('--end', default=ALL_TIME[1], help="last Jalali date")
+    parser.add_argument('--exclude-current-affairs', action='store_true')
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    args = parser.parse_args()
+
+    filters = []
+    if args.person:
+        filters.append(('person_name', args.person))
+    if args.project:
+        filters.append(('project_name', args.project))
+    if args.code:
+        filters.append(('project_code', tuple(args.code)))
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    rows = export_entries(args.output, fmt, tuple(filters), start=args.start, end=args.end,
+                          exclude_current_affairs=args.exclude_current_affairs, chunksize=args.chunksize)
+    print(f"wrote {rows} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
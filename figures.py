@@ -0,0 +1,243 @@
+"""Plotly figures for the dashboard sections.
+
+These only shape already aggregated frames into figures, so they can be
+memoized on their inputs and used without a running Streamlit session.
+
+Every chart is held to a payload budget. Bar charts show at most
+``ENG_VIS_MAX_BARS`` bars: the largest ones, then the rest binned by rank
+into ``ENG_VIS_TAIL_BINS`` "Other" bars. Stacked time series keep the
+``ENG_VIS_MAX_SERIES`` largest projects and stack the rest as "Other". When
+a figure's JSON still exceeds ``ENG_VIS_MAX_FIGURE_BYTES`` the limit is
+cut in proportion to the excess, which usually fits on the next build. The sections offer the full totals as a table.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+from dates import bucket_labels
+from instrumentation import timed
+
+MAX_BARS = int(os.environ.get("ENG_VIS_MAX_BARS", 60))
+TAIL_BINS = int(os.environ.get("ENG_VIS_TAIL_BINS", 5))
+MAX_SERIES = int(os.environ.get("ENG_VIS_MAX_SERIES", 20))
+MAX_FIGURE_BYTES = int(os.environ.get("ENG_VIS_MAX_FIGURE_BYTES", 1_000_000))
+
+
+def limit_bars(frame, label, value, max_bars=MAX_BARS, tail_bins=TAIL_BINS):
+    """At most ``max_bars`` rows: the largest by ``value``, then the rest summed in rank bins.
+
+    A frame within the budget is returned unchanged. The tail is split into
+    ``tail_bins`` runs of consecutive ranks, labelled e.g. "Other #56–200".
+    """
+    if len(frame) <= max_bars:
+        return frame
+    tail_bins = max(1, min(tail_bins, max_bars - 1))
+    kept = max_bars - tail_bins
+    ranked = frame.sort_values(value, ascending=False, kind='stable', ignore_index=True)
+    tail = ranked[value].to_numpy()[kept:]
+    bins = [ranks for ranks in np.array_split(np.arange(len(tail)), tail_bins) if len(ranks)]
+    other = pd.DataFrame({
+        label: [f"Other #{kept + ranks[0] + 1}–{kept + ranks[-1] + 1}" for ranks in bins],
+        value: [tail[ranks].sum() for ranks in bins],
+    })
+    top = ranked.iloc[:kept][[label, value]]
+    return pd.concat([top.astype({label: object}), other], ignore_index=True)
+
+
+def within_budget(build, limit, max_bytes=MAX_FIGURE_BYTES):
+    """``build(limit)``, with ``limit`` cut while the figure's JSON is over ``max_bytes``.
+
+    The payload grows about linearly with ``limit``, so it is scaled down by
+    the measured excess (with some slack) rather than halved: each attempt
+    serializes once, and one retry usually fits.
+    """
+    fig = build(limit)
+    # Built figures are already validated
+    size = len(pio.to_json(fig, validate=False))
+    while limit > 2 and size > max_bytes:
+        limit = max(2, min(limit - 1, int(limit * max_bytes * 0.9 / size)))
+        fig = build(limit)
+        size = len(pio.to_json(fig, validate=False))
+    return fig
+
+
+def _bar(frame, x, y, **kwargs):
+    return within_budget(lambda limit: px.bar(limit_bars(frame, x, y, limit), x=x, y=y, **kwargs), MAX_BARS)
+
+
+def _fold_series(bucket_hours, max_series):
+    totals = bucket_hours.groupby('project_name', observed=True)['duration'].sum()
+    if len(totals) <= max_series:
+        return bucket_hours
+    top = totals.nlargest(max_series - 1).index
+    names = bucket_hours['project_name'].astype(object)
+    folded = bucket_hours.assign(project_name=names.where(names.isin(top), 'Other'))
+    return folded.groupby(['period', 'project_name'], sort=False)['duration'].sum().reset_index()
+
+
+@timed('figure')
+def project_hours_bar(main_projects):
+    return px.bar(main_projects, x='project_name', y='total_hours', title="Total Person-Hours per Project")
+
+
+@timed('figure')
+def project_time_series(daily_hours, bucket):
+    """Stacked bars of hours per project in each time bucket."""
+    bucket_hours = daily_hours.assign(period=bucket_labels(daily_hours['date'], bucket))
+    bucket_hours = bucket_hours.groupby(['period', 'project_name'])['duration'].sum().reset_index()
+
+    def build(max_series):
+        fig = px.bar(_fold_series(bucket_hours, max_series),
+                     x='period',
+                     y='duration',
+                     color='project_name',
+                     title=f"Person-Hours per Project by {bucket}",
+                     labels={'duration': 'Duration (hours)', 'period': bucket.capitalize()})
+        fig.update_layout(barmode='stack')
+        return fig
+
+    return within_budget(build, MAX_SERIES)
+
+
+@timed('figure')
+def project_code_pie(main_projects):
+    return px.pie(
+        main_projects,
+        names='project_name',
+        values='total_hours',
+        title="Project Code Distribution",
+        hover_data={'project_name': True}
+    )
+
+
+@timed('figure')
+def source_pie(source_duration):
+    # ایجاد نمودار دایره‌ای برای map_source_str با استفاده از مجموع duration
+    fig = px.pie(
+        source_duration,
+        names='map_source_str',
+        values='total_duration',
+        title="Project Source Duration Distribution",
+        hover_data={'map_source_str': True}
+    )
+    fig.update_traces(textinfo='percent+label',
+                      hovertemplate='<b>Source:</b> %{label}<br><b>Total Duration:</b> %{value} hours<extra></extra>')
+    return fig
+
+
+@timed('figure')
+def type_pie(type_duration):
+    # ایجاد نمودار دایره‌ای برای map_tp_str با استفاده از مجموع duration
+    fig = px.pie(
+        type_duration,
+        names='map_tp_str',
+        values='total_duration',
+        title="Project Type Duration Distribution",
+        hover_data={'map_tp_str': True}
+    )
+    fig.update_traces(textinfo='percent+label',
+                      hovertemplate='<b>Type:</b> %{label}<br><b>Total Duration:</b> %{value} hours<extra></extra>')
+    return fig
+
+
+@timed('figure')
+def product_bar(product_duration):
+    return _bar(product_duration,
+                x='product',
+                y='total_duration',
+                title="Person-Hours per Product",
+                labels={'total_duration': 'Duration (hours)', 'product': 'Product'})
+
+
+@timed('figure')
+def product_project_bar(filtered_hours, product):
+    return _bar(filtered_hours,
+                x='project_name',
+                y='duration',
+                title=f"Total Person-Hours for {product}",
+                labels={'duration': 'Duration (hours)', 'task_name': 'Project Name'})
+
+
+@timed('figure')
+def task_bar(task_duration):
+    # ایجاد یک بار چارت بر اساس TASK_NAME و DURATION
+    return _bar(task_duration,
+                x='task_name',
+                y='duration',
+                title="Task Duration",
+                labels={'duration': 'Duration (hours)', 'task_name': 'Task Name'})
+
+
+@timed('figure')
+def person_project_bar(filtered_hours, person):
+    return _bar(filtered_hours,
+                x='project_name',
+                y='duration',
+                title=f"Total Person-Hours for {person}",
+                labels={'duration': 'Duration (hours)', 'task_name': 'Project Name'})
+
+
+_THRESHOLD_SCRIPT = """
+<script>
+(function () {
+    const names = %(names)s, hours = %(hours)s, cumulative = %(cumulative)s;
+    const chart = document.getElementById("threshold-chart"), slider = document.getElementById("threshold-slider");
+    const label = document.getElementById("threshold-value");
+    // hours is sorted largest first: the number of projects with at least th hours
+    function cut(th) {
+        let low = 0, high = hours.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (hours[mid] >= th) { low = mid + 1; } else { high = mid; }
+        }
+        return low;
+    }
+    function update() {
+        const threshold = parseFloat(slider.value), kept = cut(threshold);
+        const other = cumulative[hours.length] - cumulative[kept], position = Math.min(kept, cut(other));
+        const x = names.slice(0, position).concat(["Other"], names.slice(position, kept));
+        const y = hours.slice(0, position).concat([other], hours.slice(position, kept));
+        Plotly.restyle(chart, %(kind)s === "bar" ? {x: [x], y: [y]} : {labels: [x], values: [y]});
+        label.textContent = threshold.toFixed(1);
+    }
+    slider.addEventListener("input", update);
+})();
+</script>
+"""
+
+
+def _script_json(value):
+    # Project names are user data; keep them from closing the script tag
+    return json.dumps(value, ensure_ascii=False).replace("</", "<\\/")
+
+
+def threshold_html(fig, ranked, cumulative, threshold, label, kind='bar', vertical=False):
+    """``fig`` with a threshold slider that re-buckets "Other" in the browser.
+
+    ``ranked`` are the project totals largest first and ``cumulative`` their
+    running sum with a leading 0 (see ``aggregates.Aggregates``). They are
+    sent once; moving the slider does not rerun the app. Plotly.js is loaded
+    from its CDN.
+    """
+    low, high = float(ranked['total_hours'].min()), float(ranked['total_hours'].max())
+    orientation = "writing-mode: vertical-lr; direction: rtl; height: 400px;" if vertical else "width: 100%;"
+    controls = (f'<div style="font-family: sans-serif; font-size: 14px; display: flex; '
+                f'flex-direction: {"column" if vertical else "row"}; align-items: center; gap: 8px;">'
+                f'<label for="threshold-slider">{label}</label>'
+                f'<input type="range" id="threshold-slider" min="{low}" max="{high}" step="any" '
+                f'value="{threshold}" style="{orientation}">'
+                f'<span id="threshold-value">{threshold:.1f}</span></div>')
+    chart = fig.to_html(include_plotlyjs='cdn', full_html=False, div_id='threshold-chart')
+    script = _THRESHOLD_SCRIPT % {
+        'names': _script_json(ranked['project_name'].astype(str).tolist()),
+        'hours': _script_json(ranked['total_hours'].astype(float).tolist()),
+        'cumulative': _script_json([float(value) for value in cumulative]),
+        'kind': json.dumps(kind),
+    }
+    layout = "display: flex; align-items: center;" if vertical else ""
+    return f'<div style="{layout}">{controls}<div style="flex: 1;">{chart}</div></div>{script}'
+
@@ -1,14 +1,18 @@
-import pickle
-from pathlib import Path
+"""Seed the credential store with the default accounts.
 
-import streamlit_authenticator as stauth
+Only accounts missing from the store are hashed; change a password with
+``python credentials.py set <username>``.
+"""
+import credentials
 
 staff_names = ["hosseini", "babazadeh", "seydi"]
 usernames = ["hosseini", "babazadeh", "seydi"]
 passwords = ["Ho123h@", "Ba123b@", "Se123s@"]
 
-hashed_passwords = stauth.Hasher(passwords).generate()
-
-file_path = Path(__file__).parent / "hashed_pw.pkl"
-with file_path.open("wb") as file:
-    pickle.dump(hashed_passwords, file)
+if __name__ == '__main__':
+    existing = credentials.users() if credentials.CREDENTIALS_PATH.exists() else {}
+    missing = {username: (name, password) for name, username, password in zip(staff_names, usernames, passwords)
+               if username not in existing}
+    if missing:
+        credentials.set_users(missing)
+    print(f"added {len(missing)} of {len(usernames)} accounts")
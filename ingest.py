@@ -0,0 +1,247 @@
+"""Bulk import of timesheet exports into the ``engineering`` table.
+
+CSV and Excel files are read in chunks, so a file is never held in memory
+whole. Each chunk is validated with ``code_validator.validate_codes``, gets
+its ``project_name`` from the project code and is inserted in its own
+transaction. Rows already in the table (same person, date, code, task,
+duration and description) are skipped, so re-importing a file is harmless.
+Rejected rows are counted by reason and can be written out with their line
+numbers::
+
+    python ingest.py timesheets.csv
+    python ingest.py timesheets.xlsx --sheet Sheet1 --rejects rejected.csv
+
+The file needs the columns person_name, task_name, project_code, date and
+duration; project_description is optional and any other column is ignored.
+Dates may be Jalali (1403-06-18, 1403/6/18) or Gregorian. Afterwards the
+daily rollup is refreshed; running dashboards see the new rows through
+SQLite's data_version and reload on their next rerun.
+
+Each batch is sorted on the natural key before it goes in, so the
+duplicate check (answered from the natural-key index alone) and the inserts
+walk that index in order. Most of the remaining time goes into the other
+indexes from migrate.py. For a load that is large next to the table,
+``--rebuild-indexes`` drops them for the import and builds each once at the
+end; dashboard queries on the raw table are slow until then.
+"""
+import argparse
+import datetime
+import itertools
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import database
+import migrate
+import rollups
+from code_validator import CURRENT_AFFAIRS_CODE, OK, decode_code, validate_codes
+from dates import from_jalali, to_jalali
+from instrumentation import timed
+from queries import CURRENT_AFFAIRS
+
+try:
+    import openpyxl
+except ImportError:  # Excel import is optional
+    openpyxl = None
+
+COLUMNS = ['person_name', 'task_name', 'project_code', 'date', 'duration', 'project_description']
+REQUIRED = COLUMNS[:-1]
+INSERTED = ['person_name', 'task_name', 'project_code', 'project_name', 'date', 'duration', 'project_description']
+CHUNKSIZE = 100_000
+# Created by migrate.py on these columns; used to find rows that are already in the table
+NATURAL_KEY_INDEX = 'ix_engineering_natural_key'
+NATURAL_KEY = ['person_name', 'date', 'project_code', 'task_name', 'duration']
+# Page cache for the import connection; index updates dominate the insert time
+CACHE_MB = 256
+
+# Reasons besides code_validator's
+MISSING_PERSON = 'missing_person'
+MISSING_TASK = 'missing_task'
+BAD_DATE = 'bad_date'
+BAD_DURATION = 'bad_duration'
+
+_create_batch = f"CREATE TEMP TABLE IF NOT EXISTS ingest_batch ({', '.join(INSERTED)})"
+_fill_batch = f"INSERT INTO ingest_batch ({', '.join(INSERTED)}) VALUES ({', '.join('?' * len(INSERTED))})"
+# The natural key includes duration and description: one person may log the
+# same task on the same project twice a day. Imports store a missing
+# description as '', rows entered elsewhere may hold NULL; both are the same
+_insert_new = f"""
+    INSERT INTO engineering ({', '.join(INSERTED)})
+    SELECT {', '.join(INSERTED)} FROM ingest_batch AS b
+    WHERE NOT EXISTS (
+        SELECT 1 FROM engineering AS e
+        WHERE e.person_name = b.person_name AND e.date = b.date AND e.project_code = b.project_code
+          AND e.task_name IS b.task_name AND e.duration = b.duration
+          AND COALESCE(e.project_description, '') = COALESCE(b.project_description, ''))
+"""
+
+
+def read_csv(path, chunksize=CHUNKSIZE):
+    return pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize, encoding='utf-8-sig')
+
+
+def read_excel(path, chunksize=CHUNKSIZE, sheet=None):
+    """Stream a worksheet in DataFrame chunks with openpyxl's read-only mode."""
+    if openpyxl is None:
+        raise RuntimeError("Excel import needs openpyxl (pip install openpyxl)")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows, ())]
+        while True:
+            chunk = list(itertools.islice(rows, chunksize))
+            if not chunk:
+                break
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_chunks(path, chunksize=CHUNKSIZE, sheet=None):
+    if str(path).lower().endswith(('.xlsx', '.xlsm')):
+        return read_excel(path, chunksize, sheet)
+    return read_csv(path, chunksize)
+
+
+def _jalali(value):
+    """A stored-format Jalali date for a Jalali or Gregorian date, or None."""
+    if isinstance(value, datetime.date):
+        return to_jalali(value)
+    parts = str(value).strip().split(' ')[0].replace('/', '-').split('-')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    year, month, day = (int(part) for part in parts)
+    try:
+        if year >= 1700:
+            return to_jalali(datetime.date(year, month, day))
+        jalali = "%04d-%02d-%02d" % (year, month, day)
+        # Round-trips only if the day exists in that month
+        return jalali if 1 <= month <= 12 and to_jalali(from_jalali(jalali)) == jalali else None
+    except ValueError:
+        return None
+
+
+def _text(column):
+    return column.fillna('').astype(str).str.strip()
+
+
+@timed('ingest')
+def prepare(chunk):
+    """Split a chunk into rows to insert (``INSERTED`` columns) and rejected rows with a ``reason``."""
+    missing = [column for column in REQUIRED if column not in chunk.columns]
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(missing)}")
+    rows = pd.DataFrame({column: _text(chunk[column]) for column in ('person_name', 'task_name')})
+    rows['project_code'] = _text(chunk['project_code']).str.upper()
+    dates = chunk['date']
+    rows['date'] = dates.map({value: _jalali(value) for value in pd.unique(dates)})
+    rows['duration'] = pd.to_numeric(chunk['duration'], errors='coerce')
+    rows['project_description'] = (_text(chunk['project_description']) if 'project_description' in chunk
+                                   else '')
+
+    # The first failing check is the reported reason
+    reason = validate_codes(rows['project_code'])['reason'].astype(object)
+    reason[reason == CURRENT_AFFAIRS_CODE] = OK
+    reason[(rows['duration'] <= 0) | (rows['duration'] > 24) | rows['duration'].isna()] = BAD_DURATION
+    reason[rows['date'].isna()] = BAD_DATE
+    reason[rows['task_name'] == ''] = MISSING_TASK
+    reason[rows['person_name'] == ''] = MISSING_PERSON
+
+    valid = (reason == OK).to_numpy()
+    accepted = rows[valid]
+    codes, uniques = pd.factorize(accepted['project_code'])
+    names = np.array([CURRENT_AFFAIRS if code == "000000000" else decode_code(code) for code in uniques],
+                     dtype=object)
+    accepted = accepted.assign(project_name=names[codes])[INSERTED]
+    return accepted, chunk[~valid].assign(reason=reason[~valid])
+
+
+def _write_rejects(rejected, target, first):
+    # Same BOM convention as export.write_csv, so Excel reads the Persian text
+    rejected.to_csv(target, mode='w' if first else 'a', header=first, index=False,
+                    encoding='utf-8-sig' if first else 'utf-8')
+
+
+def _drop_reporting_indexes(conn):
+    """Drop the indexes of ``engineering`` other than the natural key; returns their SQL."""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'engineering' "
+        "AND sql IS NOT NULL AND name != ?", (NATURAL_KEY_INDEX,)).fetchall()
+    conn.execute("BEGIN IMMEDIATE")
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("COMMIT")
+    return [sql for _, sql in indexes]
+
+
+def ingest(path, db=None, chunksize=CHUNKSIZE, sheet=None, rejects=None, refresh=True, rebuild_indexes=False):
+    """Import ``path`` into the database; returns counts of read, inserted, duplicate and rejected rows."""
+    db = db or database.db_path
+    migrate.upgrade(db)
+    conn = migrate.connect(db)
+    conn.execute(f"PRAGMA cache_size = {-CACHE_MB * 1024}")
+    counts = {'read': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0}
+    reasons = Counter()
+    dropped = _drop_reporting_indexes(conn) if rebuild_indexes else []
+    try:
+        conn.execute(_create_batch)
+        for chunk in read_chunks(path, chunksize, sheet):
+            # Line numbers as a spreadsheet shows them, after the header
+            chunk.index = pd.RangeIndex(counts['read'] + 2, counts['read'] + 2 + len(chunk), name='line')
+            accepted, rejected = prepare(chunk)
+            # Filled in natural-key order, so the duplicate check and the
+            # inserts walk the index instead of jumping around it
+            unique = accepted.drop_duplicates().sort_values(NATURAL_KEY, kind='stable')
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(_fill_batch, zip(*(unique[column].tolist() for column in INSERTED)))
+                inserted = conn.execute(_insert_new).rowcount
+                conn.execute("DELETE FROM ingest_batch")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if rejects and len(rejected):
+                _write_rejects(rejected.reset_index(), rejects, not counts['rejected'])
+            counts['read'] += len(chunk)
+            counts['inserted'] += inserted
+            counts['duplicates'] += len(accepted) - inserted
+            counts['rejected'] += len(rejected)
+            reasons.update(rejected['reason'])
+    finally:
+        # Rebuilt even when the import failed part way
+        for sql in dropped:
+            conn.execute(sql)
+        if dropped:
+            conn.execute("ANALYZE")
+        conn.close()
+    if refresh and counts['inserted']:
+        rollups.refresh(db)
+    counts['reasons'] = dict(reasons)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a CSV or Excel timesheet export into engineering")
+    parser.add_argument('input')
+    parser.add_argument('--db', default=str(database.db_path), help="database file (default: %(default)s)")
+    parser.add_argument('--sheet', help="Excel worksheet (default: the active one)")
+    parser.add_argument('--rejects', help="write rejected rows with their line and reason to this CSV")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--no-refresh', action='store_true', help="do not refresh the daily rollup afterwards")
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help="drop the reporting indexes during the import and rebuild them at the end")
+    args = parser.parse_args()
+
+    counts = ingest(args.input, args.db, args.chunksize, args.sheet, args.rejects, refresh=not args.no_refresh,
+                    rebuild_indexes=args.rebuild_indexes)
+    print(f"{counts['read']} rows read, {counts['inserted']} inserted, {counts['duplicates']} already present, "
+          f"{counts['rejected']} rejected")
+    for reason, rows in sorted(counts['reasons'].items(), key=lambda item: -item[1]):
+        print(f"  {reason}: {rows}")
+
+
+if __name__ == '__main__':
+    main()
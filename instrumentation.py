@@ -0,0 +1,155 @@
+"""Per-rerun timing of the dashboard's hot paths.
+
+A rerun starts a ``Run`` with ``start_run``; while it is active, every
+``stage(name)`` block and every ``@timed`` function called from the same
+thread appends a record with its wall time, the number of rows it produced
+(when the result has a ``shape``) and the change in process RSS. Without an
+active run both are a single ContextVar lookup.
+
+Set ``ENG_VIS_INSTRUMENT=1`` to record every rerun, or let the users listed
+in ``ENG_VIS_ADMINS`` switch it on for their own session. Records are also
+appended as JSON lines to ``ENG_VIS_INSTRUMENT_LOG`` when that is set, in a
+rotating file. RSS is per process, so with concurrent sessions the memory
+deltas include their allocations too.
+"""
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import time
+
+ENABLED = os.environ.get("ENG_VIS_INSTRUMENT", "0") == "1"
+ADMINS = {name.strip() for name in os.environ.get("ENG_VIS_ADMINS", "").split(",") if name.strip()}
+LOG_PATH = os.environ.get("ENG_VIS_INSTRUMENT_LOG")
+LOG_MAX_BYTES = int(os.environ.get("ENG_VIS_INSTRUMENT_LOG_BYTES", 10 * 2 ** 20))
+LOG_BACKUPS = int(os.environ.get("ENG_VIS_INSTRUMENT_LOG_BACKUPS", 5))
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_current = contextvars.ContextVar('instrumentation_run', default=None)
+_logger = None
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _get_logger():
+    global _logger
+    if _logger is None and LOG_PATH:
+        _logger = logging.getLogger('engineering_visualizer.instrumentation')
+        _logger.propagate = False
+        _logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                                       encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+    return _logger
+
+
+class Run:
+    def __init__(self, label):
+        self.label = label
+        self.started_at = time.time()
+        self.records = []
+        self._start = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+
+class _Stage:
+    __slots__ = ('run', 'name', 'rows', 'start', 'rss')
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+        self.rows = None
+
+    def set_rows(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        self.rss = _rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        rss = _rss_bytes()
+        self.run.records.append({
+            'stage': self.name,
+            'ms': round(seconds * 1000, 2),
+            'rows': self.rows,
+            'rss_delta_mb': None if rss is None or self.rss is None else round((rss - self.rss) / 2 ** 20, 2),
+            'error': None if exc_type is None else exc_type.__name__,
+        })
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def set_rows(self, rows):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def start_run(label='', enabled=ENABLED):
+    """Start recording the current thread's stages; returns the Run or None."""
+    run = Run(label) if enabled else None
+    _current.set(run)
+    return run
+
+
+def finish_run(run):
+    """Stop recording and append the run to the JSONL log, if one is configured."""
+    _current.set(None)
+    if run is None:
+        return
+    logger = _get_logger()
+    if logger is not None:
+        logger.info(json.dumps({'label': run.label, 'started_at': run.started_at,
+                                'total_ms': round(run.elapsed() * 1000, 2), 'stages': run.records},
+                               ensure_ascii=False))
+
+
+def stage(name):
+    """Context manager timing a block as ``name``; call ``set_rows`` on it to record a row count."""
+    run = _current.get()
+    if run is None:
+        return _NO_STAGE
+    return _Stage(run, name)
+
+
+def timed(category):
+    """Decorator timing every call as ``<category>.<function name>``."""
+    def decorate(func):
+        name = f"{category}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = _current.get()
+            if run is None:
+                return func(*args, **kwargs)
+            with _Stage(run, name) as record:
+                result = func(*args, **kwargs)
+                shape = getattr(result, 'shape', None)
+                if shape:
+                    record.set_rows(shape[0])
+                return result
+        return wrapper
+    return decorate
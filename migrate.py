@@ -0,0 +1,186 @@
+"""Schema migrations and index maintenance for engineering_dashboard.db.
+
+Safe to run any number of times, including from every worker at startup::
+
+    python migrate.py            # apply pending migrations, WAL mode, ANALYZE
+    python migrate.py status     # show schema version, journal mode and indexes
+    python migrate.py analyze    # refresh the query planner statistics
+"""
+import argparse
+import sqlite3
+
+import database
+
+# Each entry is applied once, in order; PRAGMA user_version records how many
+# have been applied. Only ever append to this list.
+MIGRATIONS = [
+    ("covering indexes for the dashboard queries", [
+        "CREATE INDEX IF NOT EXISTS ix_engineering_project_duration "
+        "ON engineering (project_name, duration)",
+        "CREATE INDEX IF NOT EXISTS ix_engineering_project_task_duration "
+        "ON engineering (project_name, task_name, duration)",
+        "CREATE INDEX IF NOT EXISTS ix_engineering_person_project_duration "
+        "ON engineering (person_name, project_name, duration)",
+        "CREATE INDEX IF NOT EXISTS ix_engineering_code_duration "
+        "ON engineering (project_code, duration)",
+        "CREATE INDEX IF NOT EXISTS ix_engineering_date "
+        "ON engineering (date)",
+    ]),
+    ("daily rollup of hours, maintained by rollups.py", [
+        "CREATE TABLE IF NOT EXISTS engineering_daily ("
+        " project_name VARCHAR NOT NULL,"
+        " task_name VARCHAR NOT NULL,"
+        " person_name VARCHAR NOT NULL,"
+        " project_code VARCHAR NOT NULL,"
+        " date DATE NOT NULL,"
+        " duration FLOAT NOT NULL,"
+        " entries INTEGER NOT NULL,"
+        " PRIMARY KEY (project_name, task_name, person_name, project_code, date))",
+        "CREATE INDEX IF NOT EXISTS ix_engineering_daily_person "
+        "ON engineering_daily (person_name, project_name, duration)",
+        "CREATE INDEX IF NOT EXISTS ix_engineering_daily_code "
+        "ON engineering_daily (project_code, project_name, duration)",
+        "CREATE TABLE IF NOT EXISTS rollup_state ("
+        " name VARCHAR PRIMARY KEY,"
+        " high_water_mark INTEGER NOT NULL)",
+    ]),
+    ("date index on the daily rollup", [
+        "CREATE INDEX IF NOT EXISTS ix_engineering_daily_date "
+        "ON engineering_daily (date, project_name, duration)",
+    ]),
+    ("natural-key index for de-duplicating imports (ingest.py)", [
+        "CREATE INDEX IF NOT EXISTS ix_engineering_person_date_code "
+        "ON engineering (person_name, date, project_code)",
+    ]),
+    # Emptied here and refolded by the next rollups.refresh
+    ("relabel missing names in the daily rollup", [
+        "DELETE FROM engineering_daily",
+        "DELETE FROM rollup_state WHERE name = 'engineering_daily'",
+    ]),
+    # The rollup serves the per-project and per-person sums now, and the
+    # natural key answers person lookups; with task and duration in it the
+    # import's duplicate check never reads the table
+    ("natural-key index covering the import's duplicate check; drop indexes nothing uses", [
+        "DROP INDEX IF EXISTS ix_engineering_project_duration",
+        "DROP INDEX IF EXISTS ix_engineering_person_project_duration",
+        "CREATE INDEX IF NOT EXISTS ix_engineering_natural_key "
+        "ON engineering (person_name, date, project_code, task_name, duration)",
+        "DROP INDEX IF EXISTS ix_engineering_person_date_code",
+    ]),
+    # Inserts already move COUNT(*) and MAX(id); edits and deletes in place
+    # move nothing a reader could check cheaply, so they are counted here
+    ("change counter for in-place edits of engineering (snapshot.py)", [
+        "CREATE TABLE IF NOT EXISTS change_counter ("
+        " name VARCHAR PRIMARY KEY,"
+        " changes INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO change_counter (name, changes) VALUES ('engineering', 0)",
+        "CREATE TRIGGER IF NOT EXISTS engineering_updated AFTER UPDATE ON engineering BEGIN"
+        " UPDATE change_counter SET changes = changes + 1 WHERE name = 'engineering'; END",
+        "CREATE TRIGGER IF NOT EXISTS engineering_deleted AFTER DELETE ON engineering BEGIN"
+        " UPDATE change_counter SET changes = changes + 1 WHERE name = 'engineering'; END",
+    ]),
+    # The edit count a rollup was folded at; NULL for existing rollups, so the
+    # next rollups.refresh rebuilds them once
+    ("edit counter in the rollup state (rollups.py)", [
+        "ALTER TABLE rollup_state ADD COLUMN changes INTEGER",
+    ]),
+]
+
+
+def connect(path=None):
+    # Autocommit mode so transactions are only the ones opened explicitly below
+    conn = sqlite3.connect(str(path or database.db_path), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def enable_wal(conn):
+    # Readers no longer block on the data-entry writers (and vice versa)
+    return conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+
+
+def upgrade(path=None, analyze=True):
+    """Apply pending migrations and return the descriptions of those applied."""
+    conn = connect(path)
+    try:
+        enable_wal(conn)
+        applied = []
+        for number, (description, statements) in enumerate(MIGRATIONS, start=1):
+            # BEGIN IMMEDIATE takes the write lock, so concurrent starters
+            # queue here and then see the version the first one wrote
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if schema_version(conn) >= number:
+                    conn.execute("COMMIT")
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(description)
+        if applied and analyze:
+            conn.execute("ANALYZE")
+        return applied
+    finally:
+        conn.close()
+
+
+def run_analyze(path=None):
+    conn = connect(path)
+    try:
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def status(path=None):
+    conn = connect(path)
+    try:
+        indexes = conn.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+        ).fetchall()
+        return {
+            'schema_version': schema_version(conn),
+            'latest_version': len(MIGRATIONS),
+            'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0],
+            'indexes': [f"{table}.{name}" for name, table in indexes],
+        }
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate engineering_dashboard.db")
+    parser.add_argument('command', nargs='?', default='upgrade', choices=['upgrade', 'status', 'analyze'])
+    parser.add_argument('--db', default=str(database.db_path), help="database file (default: %(default)s)")
+    parser.add_argument('--no-analyze', action='store_true', help="skip ANALYZE after applying migrations")
+    args = parser.parse_args()
+
+    if args.command == 'upgrade':
+        applied = upgrade(args.db, analyze=not args.no_analyze)
+        for description in applied:
+            print(f"applied: {description}")
+        if not applied:
+            print("database is up to date")
+    elif args.command == 'analyze':
+        run_analyze(args.db)
+        print("statistics refreshed")
+    else:
+        for key, value in status(args.db).items():
+            if isinstance(value, list):
+                print(f"{key}:")
+                for item in value:
+                    print(f"  {item}")
+            else:
+                print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
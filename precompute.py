@@ -0,0 +1,148 @@
+"""Background recomputation of the heavy aggregations.
+
+A ``Precomputer`` runs registered functions (the all-history aggregates,
+the product index) in a worker thread whenever the ``DataCache`` version
+moves, and publishes each result to the cache under the same key
+``DataCache.memo`` uses. The script thread asks for results with ``get``:
+
+* a result for the current version is returned as is;
+* otherwise the worker is asked to compute it, and the last published
+  result is returned straight away, marked stale, for the UI to show with a
+  "computing…" badge until the fresh one lands;
+* only when nothing was ever published does ``get`` wait for the worker.
+
+Results requested through ``get`` are recomputed on version changes too,
+for the ``ENG_VIS_PRECOMPUTE_RECENT`` most recent ones. The watcher checks
+the data version every ``ENG_VIS_PRECOMPUTE_INTERVAL`` seconds; SQLite and
+pandas release the GIL for most of the work, so reruns keep being served
+meanwhile. With ``ENG_VIS_SHARED_CACHE`` set, results are computed once for
+all dashboard processes on the host (shared_cache.py).
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import shared_cache
+
+INTERVAL = float(os.environ.get("ENG_VIS_PRECOMPUTE_INTERVAL", 2))
+RECENT = int(os.environ.get("ENG_VIS_PRECOMPUTE_RECENT", 8))
+WORKERS = int(os.environ.get("ENG_VIS_PRECOMPUTE_WORKERS", 1))
+
+_logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_workers = {}
+
+
+class Precomputer:
+    def __init__(self, data_cache, interval=INTERVAL, recent=RECENT, workers=WORKERS, shared=None):
+        self.data_cache = data_cache
+        self.shared = shared
+        self.interval = interval
+        self.recent = recent
+        self._registered = {}
+        self._requested = OrderedDict()
+        # key -> (version, future) of the latest submission
+        self._submitted = {}
+        self._lock = threading.Lock()
+        # (data version, shared store generation) last worked out
+        self._generation = (None, None)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='precompute')
+        self._stopped = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name='precompute-watcher', daemon=True)
+        self._watcher.start()
+
+    def register(self, func, *args):
+        """Keep ``func(*args)`` computed for every data version, starting now."""
+        key = self.data_cache.memo_key(func, *args)
+        with self._lock:
+            self._registered[key] = (func, args)
+        self._submit(key, func, args, self.data_cache.current_version())
+        return key
+
+    def get(self, func, *args):
+        """``(result, fresh)`` for ``func(*args)``; a stale result while the worker computes the current one."""
+        key = self.data_cache.memo_key(func, *args)
+        with self._lock:
+            if key not in self._registered:
+                self._requested[key] = (func, args)
+                self._requested.move_to_end(key)
+                if len(self._requested) > self.recent:
+                    self._requested.popitem(last=False)
+        result, fresh = self.data_cache.lookup(key)
+        if fresh:
+            return result, True
+        future = self._submit(key, func, args, self.data_cache.version)
+        if result is None:
+            # Nothing to show yet
+            return future.result(), True
+        return result, False
+
+    def is_fresh(self, func, *args):
+        return self.data_cache.lookup(self.data_cache.memo_key(func, *args))[1]
+
+    def pending(self):
+        """Number of submissions not finished yet."""
+        with self._lock:
+            return sum(not future.done() for _, future in self._submitted.values())
+
+    def _submit(self, key, func, args, version):
+        with self._lock:
+            submitted = self._submitted.get(key)
+            # A failed computation is retried on the next request
+            if submitted is not None and submitted[0] == version and not (
+                    submitted[1].done() and submitted[1].exception() is not None):
+                return submitted[1]
+            future = self._executor.submit(self._run, key, func, args, version)
+            self._submitted[key] = (version, future)
+            return future
+
+    def _shared_generation(self, version):
+        with self._lock:
+            seen, generation = self._generation
+        if seen != version:
+            generation = self.shared.generation()
+            with self._lock:
+                self._generation = (version, generation)
+        return generation
+
+    def _run(self, key, func, args, version):
+        try:
+            if self.shared:
+                result = self.shared.fetch(key, lambda: func(*args), self._shared_generation(version))
+            else:
+                result = func(*args)
+        except Exception:
+            _logger.exception("precomputing %s failed", key)
+            raise
+        self.data_cache.publish(key, result, version)
+        return result
+
+    def _watch(self):
+        seen = None
+        while not self._stopped.wait(self.interval):
+            try:
+                version = self.data_cache.current_version()
+                if version == seen:
+                    continue
+                seen = version
+                with self._lock:
+                    jobs = {**self._requested, **self._registered}
+                for key, (func, args) in jobs.items():
+                    self._submit(key, func, args, version)
+            except Exception:
+                _logger.exception("precompute watcher failed")
+
+    def stop(self):
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def worker(data_cache):
+    """The ``Precomputer`` of ``data_cache``, started on first use."""
+    with _lock:
+        precomputer = _workers.get(data_cache)
+        if precomputer is None:
+            precomputer = _workers[data_cache] = Precomputer(data_cache, shared=shared_cache.store(data_cache.path))
+        return precomputer
@@ -0,0 +1,263 @@
+"""Aggregate queries run inside SQLite.
+
+Each chart on the dashboard only needs a handful of summed rows, so the
+``GROUP BY`` is done by the database and only the aggregated rows are
+turned into a DataFrame. The sums read the ``engineering_daily`` rollup
+(see rollups.py), which has to be refreshed before it reflects new rows.
+
+Raw timesheet entries are only ever read a page (or a streamed chunk) at a
+time, filtered and sorted by the database.
+"""
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from database import Session
+from dates import ALL_TIME
+from instrumentation import timed
+
+CURRENT_AFFAIRS = "امور جاری"
+# Stands for a missing (NULL) name in the rollup, the option lists and the entry filters
+UNNAMED = "(unnamed)"
+
+
+def run_query(statement, **params):
+    with Session() as session:
+        result = session.execute(statement, params)
+        return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+_project_hours = text("""
+    SELECT project_name, SUM(duration) AS total_hours
+    FROM engineering_daily
+    WHERE project_name != :excluded AND date BETWEEN :start AND :end
+    GROUP BY project_name
+    ORDER BY project_name
+""")
+
+_code_hours = text("""
+    SELECT project_code, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE date BETWEEN :start AND :end
+    GROUP BY project_code
+    ORDER BY project_code
+""")
+
+_product_code_hours = text("""
+    SELECT project_code, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE project_name != :excluded AND project_code IN :codes AND date BETWEEN :start AND :end
+    GROUP BY project_code
+    ORDER BY project_code
+""").bindparams(bindparam('codes', expanding=True))
+
+_product_project_hours = text("""
+    SELECT project_name, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE project_name != :excluded AND project_code IN :codes AND date BETWEEN :start AND :end
+    GROUP BY project_name
+    ORDER BY project_name
+""").bindparams(bindparam('codes', expanding=True))
+
+_task_hours = text("""
+    SELECT task_name, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE project_name = :project_name AND date BETWEEN :start AND :end
+    GROUP BY task_name
+    ORDER BY task_name
+""")
+
+_person_project_hours = text("""
+    SELECT project_name, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE person_name = :person_name AND date BETWEEN :start AND :end
+    GROUP BY project_name
+    ORDER BY project_name
+""")
+
+_daily_project_hours = text("""
+    SELECT date, project_name, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE project_name != :excluded AND date BETWEEN :start AND :end
+    GROUP BY date, project_name
+    ORDER BY date, project_name
+""")
+
+_daily_code_project_hours = text("""
+    SELECT date, project_name, SUM(duration) AS duration
+    FROM engineering_daily
+    WHERE project_name != :excluded AND project_code IN :codes AND date BETWEEN :start AND :end
+    GROUP BY date, project_name
+    ORDER BY date, project_name
+""").bindparams(bindparam('codes', expanding=True))
+
+_project_codes = text("""
+    SELECT DISTINCT project_code
+    FROM engineering_daily
+    WHERE project_name != :excluded
+    ORDER BY project_code
+""")
+
+# Distinct values in order of first appearance, like Series.unique()
+_project_names = text("""
+    SELECT COALESCE(project_name, :unnamed) AS project_name FROM engineering
+    WHERE date BETWEEN :start AND :end
+    GROUP BY project_name ORDER BY MIN(id)
+""")
+_person_names = text("""
+    SELECT COALESCE(person_name, :unnamed) AS person_name FROM engineering
+    WHERE date BETWEEN :start AND :end
+    GROUP BY person_name ORDER BY MIN(id)
+""")
+
+
+# Every query takes the Jalali (start, end) window from dates.preset_range;
+# the defaults cover all history.
+
+@timed('sql')
+def project_hours(start=ALL_TIME[0], end=ALL_TIME[1]):
+    """Total hours per project, leaving out current affairs."""
+    return run_query(_project_hours, excluded=CURRENT_AFFAIRS, start=start, end=end)
+
+
+@timed('sql')
+def code_hours(start=ALL_TIME[0], end=ALL_TIME[1]):
+    """Total hours per project code, including current affairs."""
+    return run_query(_code_hours, start=start, end=end)
+
+
+@timed('sql')
+def product_code_hours(codes, start=ALL_TIME[0], end=ALL_TIME[1]):
+    """Total hours per project code for the given codes."""
+    return run_query(_product_code_hours, excluded=CURRENT_AFFAIRS, codes=list(codes), start=start, end=end)
+
+
+@timed('sql')
+def product_project_hours(codes, start=ALL_TIME[0], end=ALL_TIME[1]):
+    """Total hours per project for the given project codes."""
+    return run_query(_product_project_hours, excluded=CURRENT_AFFAIRS, codes=list(codes), start=start, end=end)
+
+
+@timed('sql')
+def task_hours(project_name, start=ALL_TIME[0], end=ALL_TIME[1]):
+    """Total hours per task within one project."""
+    return run_query(_task_hours, project_name=project_name, start=start, end=end)
+
+
+@timed('sql')
+def person_project_hours(person_name, start=ALL_TIME[0], end=ALL_TIME[1]):
+    """Total hours per project for one person."""
+    return run_query(_person_project_hours, person_name=person_name, start=start, end=end)
+
+
+@timed('sql')
+def daily_project_hours(start=ALL_TIME[0], end=ALL_TIME[1], codes=None):
+    """Total hours per day and project, leaving out current affairs; only ``codes`` unless None."""
+    if codes is None:
+        return run_query(_daily_project_hours, excluded=CURRENT_AFFAIRS, start=start, end=end)
+    return run_query(_daily_code_project_hours, excluded=CURRENT_AFFAIRS, codes=list(codes), start=start, end=end)
+
+
+@timed('sql')
+def project_codes():
+    """Every project code used outside current affairs."""
+    return run_query(_project_codes, excluded=CURRENT_AFFAIRS)['project_code'].tolist()
+
+
+@timed('sql')
+def project_names(start=ALL_TIME[0], end=ALL_TIME[1]):
+    return run_query(_project_names, unnamed=UNNAMED, start=start, end=end)['project_name'].tolist()
+
+
+@timed('sql')
+def person_names(start=ALL_TIME[0], end=ALL_TIME[1]):
+    return run_query(_person_names, unnamed=UNNAMED, start=start, end=end)['person_name'].tolist()
+
+
+# Columns a raw-entry table may show, filter on or sort by
+ENTRY_COLUMNS = ['person_name', 'task_name', 'project_code', 'project_name', 'date', 'duration',
+                 'project_description']
+
+
+def _entries_where(filters, start, end, exclude_current_affairs):
+    """WHERE clause for raw entries.
+
+    ``filters`` is a tuple of ``(column, value)`` pairs; a tuple value
+    matches any of its items, and ``UNNAMED`` matches NULL.
+    """
+    clauses = ["date BETWEEN :start AND :end"]
+    params = {'start': start, 'end': end}
+    expanding = []
+    if exclude_current_affairs:
+        clauses.append("project_name != :excluded")
+        params['excluded'] = CURRENT_AFFAIRS
+    for number, (column, value) in enumerate(filters):
+        if column not in ENTRY_COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+        name = f"filter{number}"
+        if isinstance(value, tuple):
+            clause = f"{column} IN :{name}"
+            expanding.append(name)
+            unnamed = UNNAMED in value
+            value = list(value)
+        else:
+            clause = f"{column} = :{name}"
+            unnamed = value == UNNAMED
+        # Compared as is otherwise, so the indexes still apply
+        clauses.append(f"({clause} OR {column} IS NULL)" if unnamed else clause)
+        params[name] = value
+    return " AND ".join(clauses), params, expanding
+
+
+def _entries_statement(sql, expanding):
+    statement = text(sql)
+    if expanding:
+        statement = statement.bindparams(*(bindparam(name, expanding=True) for name in expanding))
+    return statement
+
+
+def _select_columns(columns):
+    columns = [column for column in ENTRY_COLUMNS if column in columns] or ENTRY_COLUMNS
+    return ", ".join(columns)
+
+
+@timed('sql')
+def entries_summary(filters=(), start=ALL_TIME[0], end=ALL_TIME[1], exclude_current_affairs=False):
+    """Number of matching entries and their total hours."""
+    where, params, expanding = _entries_where(filters, start, end, exclude_current_affairs)
+    statement = _entries_statement(
+        f"SELECT COUNT(*) AS entries, COALESCE(SUM(duration), 0) AS duration FROM engineering WHERE {where}",
+        expanding)
+    return run_query(statement, **params).iloc[0].to_dict()
+
+
+@timed('sql')
+def entries_page(filters=(), columns=tuple(ENTRY_COLUMNS), sort=('id', True), limit=50, offset=0,
+                 start=ALL_TIME[0], end=ALL_TIME[1], exclude_current_affairs=False):
+    """One page of raw entries, sorted in the database.
+
+    ``sort`` is ``(column, ascending)``; ``id`` breaks ties so pages are stable.
+    """
+    sort_column, ascending = sort
+    if sort_column != 'id' and sort_column not in ENTRY_COLUMNS:
+        raise ValueError(f"Unknown column: {sort_column}")
+    direction = "ASC" if ascending else "DESC"
+    order = f"{sort_column} {direction}" + ("" if sort_column == 'id' else f", id {direction}")
+    where, params, expanding = _entries_where(filters, start, end, exclude_current_affairs)
+    statement = _entries_statement(
+        f"SELECT {_select_columns(columns)} FROM engineering WHERE {where} "
+        f"ORDER BY {order} LIMIT :limit OFFSET :offset",
+        expanding)
+    return run_query(statement, limit=int(limit), offset=int(offset), **params)
+
+
+def iter_entries(filters=(), columns=tuple(ENTRY_COLUMNS), chunksize=50_000,
+                 start=ALL_TIME[0], end=ALL_TIME[1], exclude_current_affairs=False):
+    """Yield every matching entry as DataFrames of at most ``chunksize`` rows, in id order."""
+    where, params, expanding = _entries_where(filters, start, end, exclude_current_affairs)
+    statement = _entries_statement(
+        f"SELECT {_select_columns(columns)} FROM engineering WHERE {where} ORDER BY id", expanding)
+    with Session() as session:
+        result = session.execute(statement.execution_options(yield_per=chunksize), params)
+        keys = list(result.keys())
+        for rows in result.partitions(chunksize):
+            yield pd.DataFrame(rows, columns=keys)
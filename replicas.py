@@ -0,0 +1,112 @@
+"""Run N dashboard processes on one host, sharing one cache.
+
+    python replicas.py 4                    # ports 8501-8504 on 127.0.0.1
+    python replicas.py 4 --port 9000 --cache-dir /var/cache/eng-vis
+
+Before starting them the schema is migrated, the rollup refreshed and the
+Arrow snapshot written, so the replicas start by mapping the same file.
+Each replica is ``streamlit run visualizer.py`` on its own port with
+``ENG_VIS_SHARED_CACHE`` set, so a result is computed by whichever replica
+needs it first and read by the others (shared_cache.py). Stopping this
+script stops them all; if one exits, the rest are stopped too.
+
+The raw rows are not held per replica: they are read from the mapped
+snapshot, whose pages the OS holds once for everyone, and a total computed
+by one replica is read by the others from the shared cache. What each
+replica does hold is its interpreter and libraries (about 150 MB) and the
+aggregated frames and figures it serves, which grow with the number of
+distinct keys rather than rows. Measured on 1M generated rows with three
+replicas, each serving one session through every section: 310-380 MB
+proportional set size per replica, of which the snapshot pages were 30 MB
+in the replica that computed the totals and 1 MB in the two that read them.
+Plan memory per replica accordingly.
+
+Streamlit keeps a session on a websocket, so the proxy has to send a
+browser back to the same replica; with nginx::
+
+    upstream eng_vis {
+        ip_hash;
+        server 127.0.0.1:8501;
+        server 127.0.0.1:8502;
+        server 127.0.0.1:8503;
+        server 127.0.0.1:8504;
+    }
+    server {
+        listen 80;
+        location / {
+            proxy_pass http://eng_vis;
+            proxy_http_version 1.1;
+            proxy_set_header Upgrade $http_upgrade;
+            proxy_set_header Connection "upgrade";
+            proxy_set_header Host $host;
+            proxy_read_timeout 86400;
+        }
+    }
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import database
+import migrate
+import rollups
+import snapshot
+
+ROOT = Path(__file__).parent
+
+
+def prepare(db):
+    migrate.upgrade(db)
+    rollups.refresh(db)
+    if snapshot.pa is not None:
+        snapshot.refresh(db, background=False)
+
+
+def start(replicas, port, address, cache_dir):
+    env = {**os.environ, 'ENG_VIS_SHARED_CACHE': str(cache_dir), 'ENG_VIS_DB': str(database.db_path)}
+    return [subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', str(ROOT / 'visualizer.py'),
+                              '--server.port', str(port + replica), '--server.address', address,
+                              '--server.headless', 'true'], cwd=ROOT, env=env)
+            for replica in range(replicas)]
+
+
+def stop(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several dashboard processes with a shared cache")
+    parser.add_argument('replicas', type=int)
+    parser.add_argument('--port', type=int, default=8501, help="port of the first replica (default: %(default)s)")
+    parser.add_argument('--address', default='127.0.0.1', help="address to listen on (default: %(default)s)")
+    parser.add_argument('--cache-dir', type=Path, default=database.db_path.with_suffix('.cache'),
+                        help="shared result directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    prepare(database.db_path)
+    processes = start(args.replicas, args.port, args.address, args.cache_dir)
+    print(f"{args.replicas} replicas on {args.address}:{args.port}-{args.port + args.replicas - 1}, "
+          f"shared cache in {args.cache_dir}")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Daily hour totals kept in ``engineering_daily``.
+
+The rollup holds one row per (project, task, person, project code, day), so
+its size follows the number of distinct keys rather than the number of
+timesheet entries. ``refresh`` folds in rows whose ``id`` is above the
+stored high-water mark. Edits and deletes in place move the change counter
+kept by triggers (see migrate.py) instead; the rollup state records the
+count it was folded at, and when the counter has moved since, ``refresh``
+rebuilds the rollup, as rows it already holds may have changed. ``check``
+compares the rollup with the raw rows::
+
+    python rollups.py refresh
+    python rollups.py rebuild
+    python rollups.py check
+"""
+import argparse
+import os
+import sys
+
+import database
+from instrumentation import timed
+from migrate import connect
+from queries import UNNAMED
+
+ROLLUP = 'engineering_daily'
+# Page cache for folds; a fold of a large import touches every index of the rollup
+CACHE_MB = int(os.environ.get("ENG_VIS_ROLLUP_CACHE_MB", 256))
+
+# NULL keys would never collide in the primary key, so names are stored as
+# UNNAMED, which the raw-entry queries match to NULL (a NULL date is outside
+# every window)
+_KEYS = "COALESCE(project_name, :unnamed), COALESCE(task_name, :unnamed), COALESCE(person_name, :unnamed), " \
+        "COALESCE(project_code, :unnamed), COALESCE(date, '')"
+
+_fold_in = f"""
+    INSERT INTO engineering_daily (project_name, task_name, person_name, project_code, date, duration, entries)
+    SELECT {_KEYS}, COALESCE(SUM(duration), 0), COUNT(*)
+    FROM engineering
+    WHERE id > :low AND id <= :high
+    GROUP BY {_KEYS}
+    ON CONFLICT (project_name, task_name, person_name, project_code, date) DO UPDATE SET
+        duration = duration + excluded.duration,
+        entries = entries + excluded.entries
+"""
+
+_save_state = """
+    INSERT INTO rollup_state (name, high_water_mark, changes) VALUES (:name, :high, :changes)
+    ON CONFLICT (name) DO UPDATE SET high_water_mark = excluded.high_water_mark, changes = excluded.changes
+"""
+
+
+def _state(conn):
+    """The high-water mark and the edit count the rollup was folded at."""
+    row = conn.execute("SELECT high_water_mark, changes FROM rollup_state WHERE name = ?", (ROLLUP,)).fetchone()
+    return (0, None) if row is None else row
+
+
+def _edits(conn):
+    return conn.execute("SELECT changes FROM change_counter WHERE name = 'engineering'").fetchone()[0]
+
+
+def _secondary_indexes(conn):
+    return conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                        "AND sql IS NOT NULL", (ROLLUP,)).fetchall()
+
+
+def _fold(conn, low):
+    """Fold the rows above ``low`` into the rollup; returns the new high-water mark."""
+    high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM engineering").fetchone()[0]
+    if high <= low:
+        return low
+    # Folding more keys than the rollup holds is cheaper with the secondary
+    # indexes built once afterwards than updated key by key
+    rebuilt = []
+    if high - low > conn.execute(f"SELECT COUNT(*) FROM {ROLLUP}").fetchone()[0]:
+        rebuilt = _secondary_indexes(conn)
+        for name, _ in rebuilt:
+            conn.execute(f"DROP INDEX {name}")
+    conn.execute(_fold_in, {'low': low, 'high': high, 'unnamed': UNNAMED})
+    for _, sql in rebuilt:
+        conn.execute(sql)
+    return high
+
+
+def _connect(path):
+    conn = connect(path)
+    conn.execute(f"PRAGMA cache_size = {-CACHE_MB * 1024}")
+    return conn
+
+
+def _clear(conn):
+    conn.execute("DELETE FROM engineering_daily")
+    conn.execute("DELETE FROM rollup_state WHERE name = ?", (ROLLUP,))
+
+
+@timed('rollup')
+def refresh(path=None):
+    """Fold rows added since the last refresh into the rollup, or rebuild it after edits in place.
+
+    Returns how far the high-water mark moved, from 0 on a rebuild (0 when
+    there was nothing to do, in which case nothing is written).
+    """
+    conn = _connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            low, folded_at = _state(conn)
+            edits = _edits(conn)
+            if folded_at != edits:
+                # Rows it already holds may have been edited or deleted
+                _clear(conn)
+                low = 0
+            high = _fold(conn, low)
+            changed = high != low or folded_at != edits
+            if changed:
+                conn.execute(_save_state, {'name': ROLLUP, 'high': high, 'changes': edits})
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT" if changed else "ROLLBACK")
+        return high - low
+    finally:
+        conn.close()
+
+
+def rebuild(path=None):
+    """Recompute the whole rollup from the raw table."""
+    conn = _connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _clear(conn)
+            conn.execute(_save_state, {'name': ROLLUP, 'high': _fold(conn, 0), 'changes': _edits(conn)})
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return conn.execute("SELECT COUNT(*) FROM engineering_daily").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def rows(path=None):
+    """Number of rows in the rollup."""
+    conn = connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {ROLLUP}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def check(path=None, tolerance=1e-6):
+    """Compare the rollup with the raw rows it has covered so far."""
+    conn = connect(path)
+    try:
+        # One read transaction, so both sides see the same data
+        conn.execute("BEGIN")
+        mark, folded_at = _state(conn)
+        edits = _edits(conn)
+        raw = {tuple(row[:5]): row[5:] for row in conn.execute(f"""
+            SELECT {_KEYS}, COALESCE(SUM(duration), 0), COUNT(*)
+            FROM engineering WHERE id <= :mark GROUP BY {_KEYS}
+        """, {'mark': mark, 'unnamed': UNNAMED})}
+        rolled = {tuple(row[:5]): row[5:] for row in conn.execute(
+            "SELECT project_name, task_name, person_name, project_code, date, duration, entries "
+            "FROM engineering_daily")}
+        pending = conn.execute("SELECT COUNT(*) FROM engineering WHERE id > ?", (mark,)).fetchone()[0]
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    mismatched = [key for key in raw.keys() | rolled.keys()
+                  if key not in raw or key not in rolled
+                  or raw[key][1] != rolled[key][1] or abs(raw[key][0] - rolled[key][0]) > tolerance]
+    return {
+        'consistent': not mismatched,
+        'high_water_mark': mark,
+        'pending_rows': pending,
+        'pending_edits': folded_at != edits,
+        'mismatched_keys': len(mismatched),
+        'raw_hours': sum(duration for duration, _ in raw.values()),
+        'rollup_hours': sum(duration for duration, _ in rolled.values()),
+        'examples': sorted(mismatched)[:10],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the engineering_daily rollup")
+    parser.add_argument('command', choices=['refresh', 'rebuild', 'check'])
+    parser.add_argument('--db', default=str(database.db_path), help="database file (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        print(f"high-water mark moved by {refresh(args.db)} ids")
+    elif args.command == 'rebuild':
+        print(f"rollup rebuilt with {rebuild(args.db)} rows")
+    else:
+        result = check(args.db)
+        for key, value in result.items():
+            print(f"{key}: {value}")
+        if not result['consistent']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+"""The dashboard sections.
+
+Only the section picked in ``visualizer.py`` is rendered on a rerun, and
+each section runs as a fragment where Streamlit supports it, so moving one
+of its widgets reruns (and re-sends) that section alone. Queries and
+figures are memoized in the shared ``DataCache`` on their input parameters;
+the hour totals of every section come from one ``aggregates.compute`` per
+date window. The heavy aggregations go through the precompute worker: after
+a data change a section shows the previous totals with a "computing…" badge
+and reruns once the fresh ones are published.
+
+The drill bar narrows every section to part of the code hierarchy
+(equipment, subset, product, code), a source, a type or a project; clicking
+a source or type slice, a product bar or a project bar does the same. Each
+step is ``Aggregates.drill`` on the window's cached totals.
+"""
+import os
+import tempfile
+
+import streamlit as st
+import streamlit.components.v1 as components
+import streamlit_vertical_slider as svs
+
+import aggregates
+import export
+import figures
+import precompute
+import queries
+from code_validator import HIERARCHY, build_product_index
+from instrumentation import stage
+
+PAGE_SIZES = [25, 50, 100, 250]
+# Larger exports are left to export.py: a download is held in the server's memory until it is sent
+EXPORT_MAX_ROWS = int(os.environ.get("ENG_VIS_EXPORT_MAX_ROWS", 100_000))
+# Handle the "minimum hours" sliders in the browser instead of rerunning the section
+CLIENT_THRESHOLDS = os.environ.get("ENG_VIS_CLIENT_THRESHOLDS", "0") == "1"
+# Seconds between checks for a fresh result while a stale one is shown
+PRECOMPUTE_POLL = float(os.environ.get("ENG_VIS_PRECOMPUTE_POLL", 1))
+
+# The drill bar's selectboxes; a project is only picked by clicking its bar
+DRILL_LABELS = {'equipment': "Equipment", 'subset': "Subset", 'product': "Product", 'project_code': "Code",
+                'map_source_str': "Source", 'map_tp_str': "Type"}
+ALL = "All"
+
+# st.fragment needs Streamlit 1.37; older versions rerun the whole page
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda func: func)
+
+
+def load_product_index():
+    return build_product_index(queries.project_codes())
+
+
+def clamp_state(key, low, high):
+    # A remembered slider value can fall outside a narrower date range
+    if key in st.session_state:
+        value = st.session_state[key]
+        if not low <= value <= high:
+            st.session_state[key] = min(max(value, low), high)
+
+
+def entries_table(data_cache, key, filters, window, exclude_current_affairs=False):
+    """Paginated table of raw entries; only the visible page is queried and sent."""
+    summary = data_cache.memo(queries.entries_summary, filters, *window, exclude_current_affairs)
+    entries = int(summary['entries'])
+
+    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+    with col1:
+        columns = st.multiselect("Columns", options=queries.ENTRY_COLUMNS, default=queries.ENTRY_COLUMNS,
+                                 key=f'{key}_columns')
+    with col2:
+        sort_column = st.selectbox("Sort by", options=['id'] + queries.ENTRY_COLUMNS, key=f'{key}_sort')
+    with col3:
+        ascending = st.radio("Order", options=["Ascending", "Descending"], key=f'{key}_order') == "Ascending"
+    with col4:
+        page_size = st.selectbox("Rows per page", options=PAGE_SIZES, key=f'{key}_page_size')
+        pages = max(1, -(-entries // page_size))
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f'{key}_page')
+
+    columns = tuple(columns)
+    page_df = data_cache.memo(queries.entries_page, filters, columns, (sort_column, ascending), page_size,
+                              (page - 1) * page_size, *window, exclude_current_affairs)
+    with stage('serialize.dataframe') as record:
+        record.set_rows(len(page_df))
+        st.dataframe(page_df, hide_index=True, use_container_width=True)
+    st.caption(f"{entries} entries, {summary['duration']} hours")
+
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.radio("Export format", options=export.FORMATS, horizontal=True, key=f'{key}_export_format')
+    with col2:
+        file_name = f"{key}_entries.{fmt}"
+        if entries > EXPORT_MAX_ROWS:
+            st.caption(f"Exports of more than {EXPORT_MAX_ROWS} entries are made with export.py:")
+            st.code(export.command(file_name, filters, *window, exclude_current_affairs), language='bash')
+        else:
+            # Only written when the button is clicked
+            st.download_button("Download", data=lambda: export_file(fmt, filters, columns, window,
+                                                                     exclude_current_affairs),
+                               file_name=file_name, key=f'{key}_download')
+
+
+def export_file(fmt, filters, columns, window, exclude_current_affairs):
+    """The export as bytes; streamed to a temporary file in chunks, never built as one frame."""
+    with tempfile.NamedTemporaryFile(suffix=f'.{fmt}', delete=False) as file:
+        path = file.name
+    try:
+        with stage('export.entries'):
+            export.export_entries(path, fmt, filters, columns, *window, exclude_current_affairs)
+        with open(path, 'rb') as file:
+            return file.read()
+    finally:
+        os.remove(path)
+
+
+def show_chart(fig):
+    # Serializing the figure to the browser is timed on its own
+    with stage('serialize.plotly_chart'):
+        st.plotly_chart(fig)
+
+
+def kept_projects(totals, threshold):
+    """How many projects the threshold charts show on their own, at most the bar budget."""
+    kept = totals.cut(threshold)
+    if kept > figures.MAX_BARS - 1:
+        st.caption(f"{kept} projects are above the threshold; the {figures.MAX_BARS - 1} largest are shown "
+                   f"and the rest are in Other.")
+    return min(kept, figures.MAX_BARS - 1)
+
+
+def full_detail(frame, key, noun):
+    """The full totals behind a chart that binned its long tail, as a table on request."""
+    if len(frame) > figures.MAX_BARS and st.toggle(f"Show all {len(frame)} {noun}", key=f'{key}_all'):
+        with stage('serialize.dataframe') as record:
+            record.set_rows(len(frame))
+            st.dataframe(frame.sort_values('duration', ascending=False), hide_index=True,
+                         use_container_width=True)
+
+
+def figure(data_cache, name, build, *params):
+    """Build a figure once per data version and set of parameters."""
+    return data_cache.cached(('figure', name) + params, build)
+
+
+def totals_table(data_cache, totals, name, *args):
+    """``totals.<name>(*args)`` once per data version, drill-down and arguments."""
+    return data_cache.cached(('totals', name, totals) + args, lambda: getattr(totals, name)(*args))
+
+
+def _swap_when_fresh(data_cache, func, args):
+    if precompute.worker(data_cache).is_fresh(func, *args):
+        st.rerun()
+
+
+if hasattr(st, 'fragment'):
+    # Polls in the browser session until the worker has published the fresh result
+    _swap_when_fresh = st.fragment(run_every=PRECOMPUTE_POLL)(_swap_when_fresh)
+
+
+def precomputed(data_cache, func, *args):
+    """``func(*args)`` from the precompute worker, or its last result with a badge while it is recomputed.
+
+    Figures built from the result should include it in their cache key, so
+    ones drawn from a stale result are rebuilt once the fresh one arrives.
+    """
+    result, fresh = precompute.worker(data_cache).get(func, *args)
+    if not fresh:
+        if hasattr(st, 'badge'):
+            st.badge("computing…", icon=":material/hourglass_top:", color='orange')
+        else:
+            st.caption("computing…")
+        if hasattr(st, 'fragment'):
+            _swap_when_fresh(data_cache, func, args)
+    return result
+
+
+def drill_selection(except_level=None):
+    """The current drill-down as ``(level, value)`` pairs, optionally leaving out one level."""
+    return tuple((level, st.session_state[f'drill_{level}']) for level in aggregates.DRILL_LEVELS
+                 if level != except_level and st.session_state.get(f'drill_{level}', ALL) != ALL)
+
+
+def drill_filters(totals):
+    """Entry filters matching the drill-down of ``totals``."""
+    return () if totals.drilled_codes is None else (('project_code', totals.drilled_codes),)
+
+
+def _clear_below(level):
+    # A subset, product or code picked under the previous parent no longer applies
+    if level in HIERARCHY:
+        for deeper in HIERARCHY[HIERARCHY.index(level) + 1:]:
+            st.session_state[f'drill_{deeper}'] = ALL
+
+
+def clear_drill():
+    for level in aggregates.DRILL_LEVELS:
+        st.session_state[f'drill_{level}'] = ALL
+
+
+def drill_bar(data_cache, window):
+    """Selectboxes narrowing every section; also applies a drill-down clicked on a chart."""
+    totals, _ = precompute.worker(data_cache).get(aggregates.compute, *window)
+    click = st.session_state.pop('drill_click', None)
+    if click is not None:
+        level, value, chart_key = click
+        # Forget the chart's selection, or it would drill again on every rerun
+        st.session_state.pop(chart_key, None)
+        if value in totals.code_index[level]:
+            _clear_below(level)
+            st.session_state[f'drill_{level}'] = value
+    # A narrower date window can leave a picked value without entries
+    for level in aggregates.DRILL_LEVELS:
+        value = st.session_state.get(f'drill_{level}', ALL)
+        if value != ALL and value not in totals.code_index[level]:
+            st.session_state[f'drill_{level}'] = ALL
+
+    selection = drill_selection()
+    columns = st.columns(len(DRILL_LABELS) + 1)
+    for column, (level, label) in zip(columns, DRILL_LABELS.items()):
+        with column:
+            st.selectbox(label, options=[ALL] + totals.options(level, selection), key=f'drill_{level}',
+                         on_change=_clear_below, args=(level,),
+                         disabled=level == 'subset' and st.session_state.get('drill_equipment', ALL) == ALL)
+    with columns[-1]:
+        st.text(" ")
+        st.button("Clear", key='drill_clear', on_click=clear_drill, disabled=not selection)
+    project = st.session_state.get('drill_project_name', ALL)
+    if project != ALL:
+        st.caption(f"Project: {project}")
+
+
+def drill_chart(fig, key, level):
+    """Show ``fig``; clicking a bar or slice drills every section down to it."""
+    with stage('serialize.plotly_chart'):
+        event = st.plotly_chart(fig, key=key, on_select='rerun', selection_mode='points')
+    points = event.selection.points if event else []
+    if points:
+        st.session_state['drill_click'] = (level, points[0].get('label', points[0].get('x')), key)
+        # The drill bar is outside this fragment
+        st.rerun()
+
+
+def window_aggregates(data_cache, window):
+    """The window's totals narrowed to the drill-down."""
+    return precomputed(data_cache, aggregates.compute, *window).drill(drill_selection())
+
+
+def client_threshold_chart(data_cache, name, build, totals, window, threshold, label, kind, vertical=False):
+    """Send the chart with every project total once; its slider re-buckets "Other" client-side."""
+    html = data_cache.cached(('threshold_html', name, totals) + window, lambda: figures.threshold_html(
+        build(totals.split_other(threshold)), totals.ranked, totals.cumulative, threshold, label, kind, vertical))
+    with stage('serialize.threshold_html'):
+        components.html(html, height=520)
+
+
+def project_hours_or_notice(totals):
+    # محاسبه مجموع ساعات کاری برای هر پروژه (به جز "امور جاری") در خود دیتابیس
+    project_hours = totals.project_hours
+    if project_hours.empty:
+        st.info("No timesheet entries in the selected period.")
+    return project_hours
+
+
+@fragment
+def render_projects(data_cache, window, bucket):
+    totals = window_aggregates(data_cache, window)
+    project_hours = project_hours_or_notice(totals)
+    if project_hours.empty:
+        return
+
+    # دریافت کمترین و بیشترین ساعت کاری برای تنظیم مقادیر اسلایدر
+    min_hours = project_hours['total_hours'].min()
+    max_hours = project_hours['total_hours'].max()
+
+    default = min(max(21.5, min_hours), max_hours)
+    if min_hours == max_hours:
+        # Equal totals (e.g. one project after drilling down) leave nothing to slide over
+        kept = kept_projects(totals, min_hours)
+        show_chart(figure(data_cache, 'project_hours_bar', lambda: figures.project_hours_bar(totals.top(kept)),
+                          totals, window, kept))
+    elif CLIENT_THRESHOLDS:
+        client_threshold_chart(data_cache, 'project_hours_bar', figures.project_hours_bar, totals, window, default,
+                               "Select minimum hours to display", 'bar')
+    else:
+        # ایجاد اسلایدر برای انتخاب حداقل ساعات مورد نظر و ذخیره مقدار آن در session_state
+        clamp_state('threshold', min_hours, max_hours)
+        threshold = st.slider(
+            "Select minimum hours to display",
+            min_value=min_hours,
+            max_value=max_hours,
+            value=default,
+            key='threshold'
+        )
+
+        # رسم نمودار
+        # Thresholds keeping the same projects share one figure
+        kept = kept_projects(totals, threshold)
+        fig = figure(data_cache, 'project_hours_bar', lambda: figures.project_hours_bar(totals.top(kept)),
+                     totals, window, kept)
+        show_chart(fig)
+
+    # Hours per project in each day/week/month of the selected period, under the drill-down
+    codes = totals.drilled_codes
+    fig_time = figure(data_cache, 'project_time_series',
+                      lambda: figures.project_time_series(
+                          data_cache.memo(aggregates.daily_project_hours, *window, codes), bucket),
+                      window, bucket, codes)
+    show_chart(fig_time)
+
+
+@fragment
+def render_code_distribution(data_cache, window, bucket):
+    totals = window_aggregates(data_cache, window)
+    project_hours = project_hours_or_notice(totals)
+    if project_hours.empty:
+        return
+    min_hours = project_hours['total_hours'].min()
+    max_hours = project_hours['total_hours'].max()
+
+    st.subheader("Project Code Distribution")
+    default = min(max(48, min_hours), max_hours)
+    if min_hours == max_hours:
+        kept = kept_projects(totals, min_hours)
+        show_chart(figure(data_cache, 'project_code_pie', lambda: figures.project_code_pie(totals.top(kept)),
+                          totals, window, kept))
+        return
+    if CLIENT_THRESHOLDS:
+        client_threshold_chart(data_cache, 'project_code_pie', figures.project_code_pie, totals, window, default,
+                               "Minimum hours", 'pie', vertical=True)
+        return
+    col1, col2, col3, col4, col5 = st.columns([1, 1, 3, 1, 1])
+    with col2:
+        st.text(" ")
+        st.text(" ")
+        st.text(" ")
+        st.text(" ")
+        st.text(" ")
+        st.text(" ")
+        st.text(" ")
+        clamp_state('threshold2', min_hours, max_hours)
+        threshold2 = svs.vertical_slider(default_value=default,
+
+                                        key='threshold2',
+                                        min_value=min_hours,
+                                        max_value=max_hours,
+                                        slider_color='blue',  # optional
+                                        track_color='#FBFBFB',  # optional
+                                        thumb_color='#F3F3E0',  # optional
+                                        )
+
+    kept = kept_projects(totals, threshold2)
+    fig1 = figure(data_cache, 'project_code_pie', lambda: figures.project_code_pie(totals.top(kept)),
+                  totals, window, kept)
+    with col3:
+        show_chart(fig1)
+
+
+@fragment
+def render_source_type(data_cache, window, bucket):
+    # Each chart leaves out its own level, so the other slices stay clickable
+    base = precomputed(data_cache, aggregates.compute, *window)
+    by_source = base.drill(drill_selection('map_source_str'))
+    by_type = base.drill(drill_selection('map_tp_str'))
+    by_product = base.drill(drill_selection('product'))
+    fig2 = figure(data_cache, 'source_pie', lambda: figures.source_pie(by_source.source_duration), by_source, window)
+    fig3 = figure(data_cache, 'type_pie', lambda: figures.type_pie(by_type.type_duration), by_type, window)
+    col1, col2 = st.columns(2)
+    with col1:
+        drill_chart(fig2, 'source_pie_select', 'map_source_str')
+    with col2:
+        drill_chart(fig3, 'type_pie_select', 'map_tp_str')
+    fig_product = figure(data_cache, 'product_bar', lambda: figures.product_bar(by_product.product_duration),
+                         by_product, window)
+    drill_chart(fig_product, 'product_bar_select', 'product')
+
+
+@fragment
+def render_product(data_cache, window, bucket):
+    # The product index is built once per data version; selections are lookups
+    product_index = precomputed(data_cache, load_product_index)
+    totals = window_aggregates(data_cache, window)
+    unique_product_names = sorted(product_index)
+    if totals.drilled_codes is not None:
+        drilled = set(totals.drilled_codes)
+        unique_product_names = [name for name in unique_product_names if product_index[name]['codes'] & drilled]
+
+    # Create a selectbox for product names
+    st.subheader("Filter By Product Name")
+    selected_product_name = st.selectbox("Select Product Name", options=unique_product_names)
+
+    # Filter data based on the selected product name
+    product_codes = tuple(sorted(product_index[selected_product_name]['codes'])) if selected_product_name else ()
+    # Calculate cumulative duration per project
+    project_duration = totals_table(data_cache, totals, 'product_code_hours', product_codes)
+
+    # Display the total sum of durations
+    total_duration = project_duration['duration'].sum()
+    st.subheader(f"Total Duration for {selected_product_name} : {total_duration} hours")
+    # Display the filtered data
+    entries_table(data_cache, 'product', (('project_code', product_codes),) + drill_filters(totals), window,
+                  exclude_current_affairs=True)
+
+    # Create a bar chart to visualize cumulative duration per project
+    project_hours = totals_table(data_cache, totals, 'product_project_hours', product_codes)
+    fig = figure(data_cache, 'product_project_bar',
+                 lambda: figures.product_project_bar(project_hours, selected_product_name),
+                 totals, selected_product_name, window)
+    drill_chart(fig, 'product_project_bar_select', 'project_name')
+    full_detail(project_hours, 'product', "projects")
+
+
+@fragment
+def render_project(data_cache, window, bucket):
+    st.subheader("Filter By Project Name")
+    totals = window_aggregates(data_cache, window)
+    unique_project_codes = data_cache.memo(queries.project_names, *window)
+    if totals.drilled_codes is not None:
+        drilled = set(totals.cube['project_name'])
+        unique_project_codes = [name for name in unique_project_codes if name in drilled]
+    selected_project_code = st.selectbox("Select Project Code", options=unique_project_codes)
+
+    # فیلتر کردن داده‌ها بر اساس project_code انتخاب‌شده
+    entries_table(data_cache, 'project', (('project_name', selected_project_code),) + drill_filters(totals), window)
+
+    task_hours = totals_table(data_cache, totals, 'task_hours', selected_project_code)
+    fig4 = figure(data_cache, 'task_bar', lambda: figures.task_bar(task_hours), totals, selected_project_code, window)
+    show_chart(fig4)
+    full_detail(task_hours, 'project', "tasks")
+
+
+@fragment
+def render_person(data_cache, window, bucket):
+    # Additional Filtering Options
+    st.subheader("Filter By Person")
+    totals = window_aggregates(data_cache, window)
+    person_names = data_cache.memo(queries.person_names, *window)
+    if totals.drilled_codes is not None:
+        drilled = set(totals.cube['person_name'])
+        person_names = [name for name in person_names if name in drilled]
+    selected_person = st.selectbox("Select Person", options=person_names)
+    st.subheader(f"Information for Person: {selected_person}")
+    entries_table(data_cache, 'person', (('person_name', selected_person),) + drill_filters(totals), window)
+
+    # Visualization for filtered data
+    project_hours = totals_table(data_cache, totals, 'person_project_hours', selected_person)
+    fig5 = figure(data_cache, 'person_project_bar',
+                  lambda: figures.person_project_bar(project_hours, selected_person),
+                  totals, selected_person, window)
+    show_chart(fig5)
+    full_detail(project_hours, 'person', "projects")
+
+
+SECTIONS = {
+    "Projects": render_projects,
+    "Project Code Distribution": render_code_distribution,
+    "Source & Type": render_source_type,
+    "Product": render_product,
+    "Project": render_project,
+    "Person": render_person,
+}
@@ -0,0 +1,134 @@
+"""Aggregated results shared by several dashboard processes on one host.
+
+With ``ENG_VIS_SHARED_CACHE`` set to a directory, every result the
+precompute worker produces (per-window aggregates, the product index) is
+written there, one pickle per key, under a *generation* read from the
+database itself: the row count, highest id and edit counter of
+``engineering``, the rollup's high-water mark and the edit count it was
+folded at, the schema version and the taxonomy version, none of which
+needs more than a count over the smallest index. The precompute worker
+works it out once per data version and passes it to ``fetch``. Processes
+that see the same data compute the same generation, so the first one to
+need a result computes it while holding an ``flock`` on its key, and the
+others wait on that lock and read the file instead of computing it again.
+A result is only written when the database still has that generation
+afterwards and any snapshot mapped meanwhile matched it; otherwise it is
+returned to its caller but not shared.
+
+The raw rows are shared through the memory-mapped Arrow snapshot
+(snapshot.py), whose pages the OS keeps once for all processes; what each
+process holds on its own is its interpreter, Streamlit and the aggregated
+frames it is serving (see replicas.py for measurements and for running N
+workers behind a reverse proxy).
+
+Generations older than ``ENG_VIS_SHARED_CACHE_TTL`` seconds are removed by
+whichever process writes next. The directory is created private to the
+user running the dashboard; only point it at a directory you trust, as the
+results are pickles.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import database
+import snapshot
+
+try:
+    import fcntl
+except ImportError:  # Without flock every process computes its own results
+    fcntl = None
+
+SHARED_CACHE_DIR = os.environ.get("ENG_VIS_SHARED_CACHE")
+SHARED_CACHE_TTL = float(os.environ.get("ENG_VIS_SHARED_CACHE_TTL", 3600))
+# Bump when the pickled result types change shape
+FORMAT = 2
+
+_rollup_stamp_query = """
+    SELECT COALESCE(MAX(high_water_mark), 0), MAX(changes) FROM rollup_state WHERE name = 'engineering_daily'
+"""
+
+
+class SharedStore:
+    def __init__(self, directory, db=None, ttl=SHARED_CACHE_TTL):
+        self.directory = Path(directory)
+        self.db = db
+        self.ttl = ttl
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    def _state(self):
+        """The database's data stamp (as snapshot.py writes it) and the generation named after it."""
+        conn = sqlite3.connect(f"file:{Path(self.db or database.db_path)}?mode=ro", uri=True, timeout=30)
+        try:
+            conn.execute("BEGIN")
+            data = snapshot.data_stamp(conn)
+            mark, folded_at = conn.execute(_rollup_stamp_query).fetchone()
+            stamp = f"{FORMAT}:{data}:{mark}:{folded_at}:{conn.execute('PRAGMA user_version').fetchone()[0]}"
+        finally:
+            conn.close()
+        return data, hashlib.sha1(stamp.encode()).hexdigest()[:16]
+
+    def generation(self):
+        """A name for the data as it is now, the same in every process."""
+        return self._state()[1]
+
+    def _path(self, generation, key):
+        return self.directory / generation / f"{hashlib.sha1(repr(key).encode()).hexdigest()}.pkl"
+
+    def fetch(self, key, compute, generation=None):
+        """``compute()`` for ``generation`` (by default the current one), computed by one process and read
+        by the rest."""
+        generation = generation or self.generation()
+        path = self._path(generation, key)
+        if path.exists():
+            return self._read(path)
+        path.parent.mkdir(mode=0o700, exist_ok=True)
+        with open(f"{path}.lock", 'w') as lock:
+            if fcntl is not None:
+                # Blocks while another process computes the same result
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if path.exists():
+                return self._read(path)
+            mapped = snapshot.table_stamp()
+            result = compute()
+            data, current = self._state()
+            # A result computed from a snapshot of other data, or for data
+            # that has moved on, would be served to every process
+            if current != generation or not {mapped, snapshot.table_stamp()} <= {None, data}:
+                return result
+            self._write(path, result)
+        self.prune(keep=generation)
+        return result
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+    @staticmethod
+    def _write(path, result):
+        # Written next to the target and renamed over it, so readers never see half a file
+        descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def prune(self, keep=None):
+        """Remove generations other than ``keep`` that nobody has written to for ``ttl`` seconds."""
+        cutoff = time.time() - self.ttl
+        for generation in self.directory.iterdir():
+            if generation.is_dir() and generation.name != keep and generation.stat().st_mtime < cutoff:
+                shutil.rmtree(generation, ignore_errors=True)
+
+
+def store(db=None):
+    """The shared store configured by ``ENG_VIS_SHARED_CACHE``, or None when processes cache on their own."""
+    return SharedStore(SHARED_CACHE_DIR, db) if SHARED_CACHE_DIR else None
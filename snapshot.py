@@ -0,0 +1,270 @@
+"""Columnar snapshot of the ``engineering`` table for fast cold starts.
+
+The table, with every project code decoded, is written to an uncompressed
+Arrow IPC file (``ENG_VIS_SNAPSHOT``, by default next to the database) that
+is opened with ``mmap``: a new process maps it instead of querying SQLite,
+and only the columns a computation selects are ever paged in. Text columns
+are dictionary-encoded; ``date`` stays a Jalali string so a date window
+filters it the same way the SQL ``BETWEEN`` does.
+
+The file records the row count, highest id, edit counter (kept by triggers
+from migrate.py) and taxonomy version it was built from. ``refresh``
+compares those with the database (once per data version) and maps the file
+when they match. When they do
+not, it rewrites the file in a background thread and ``table()`` returns
+None until then, so callers fall back to SQL::
+
+    python snapshot.py write
+    python snapshot.py status
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import database
+import migrate
+import taxonomy
+from code_validator import DECODED_COLUMNS, decode_codes
+from dates import ALL_TIME
+from instrumentation import timed
+from queries import UNNAMED
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # Without pyarrow every computation reads SQLite
+    pa = pc = None
+
+try:
+    import fcntl
+except ImportError:  # No cross-process write lock on Windows
+    fcntl = None
+
+# Columns kept as read; a NULL name is stored as UNNAMED like in the daily rollup
+TEXT_COLUMNS = ['person_name', 'task_name', 'project_code', 'project_name']
+COLUMNS = ['id'] + TEXT_COLUMNS + ['date', 'duration'] + DECODED_COLUMNS
+
+# Bump when the file layout or the stored values change
+FORMAT = 4
+# Inserts move the count and highest id, updates and deletes the counter
+_stamp_query = """
+    SELECT COUNT(*), COALESCE(MAX(id), 0),
+           (SELECT changes FROM change_counter WHERE name = 'engineering')
+    FROM engineering
+"""
+
+_lock = threading.Lock()
+_table = None
+_table_stamp = None
+_writer = None
+
+
+def snapshot_path(db=None):
+    default = Path(db or database.db_path).with_suffix('.arrow')
+    return Path(os.environ.get("ENG_VIS_SNAPSHOT", default))
+
+
+def _connect(db):
+    # Read-only; the open transaction keeps the stamp and the rows consistent
+    conn = sqlite3.connect(f"file:{Path(db or database.db_path)}?mode=ro", uri=True, timeout=30)
+    conn.execute("BEGIN")
+    return conn
+
+
+def data_stamp(conn):
+    count, max_id, changes = conn.execute(_stamp_query).fetchone()
+    # The decoded columns go stale with the taxonomy
+    return f"{FORMAT}:{count}:{max_id}:{changes}:{taxonomy.current().version}"
+
+
+def _arrow_chunk(chunk):
+    for column in TEXT_COLUMNS:
+        chunk[column] = chunk[column].fillna(UNNAMED).astype('category')
+    chunk['date'] = chunk['date'].fillna('')
+    decoded = decode_codes(chunk['project_code'].astype(object))
+    frame = pd.concat([chunk, decoded], axis=1)
+    schema_types = {'id': pa.int64(), 'date': pa.string(), 'duration': pa.float64()}
+    table = pa.Table.from_pandas(frame[COLUMNS], preserve_index=False)
+    return table.cast(pa.schema([
+        pa.field(name, schema_types.get(name, pa.dictionary(pa.int32(), pa.string()))) for name in COLUMNS]))
+
+
+@timed('snapshot')
+def write(db=None, path=None):
+    """Write the snapshot of ``db`` to ``path``; returns the data stamp it was built from."""
+    if pa is None:
+        raise RuntimeError("The snapshot needs pyarrow (pip install pyarrow)")
+    path = Path(path or snapshot_path(db))
+    conn = _connect(db)
+    try:
+        stamp = data_stamp(conn)
+        query = f"SELECT id, {', '.join(TEXT_COLUMNS)}, date, duration FROM engineering ORDER BY id"
+        tables = [_arrow_chunk(chunk) for chunk in pd.read_sql(query, conn, chunksize=database.LOAD_CHUNKSIZE)]
+    finally:
+        conn.close()
+    if tables:
+        # One dictionary per column across batches, as the IPC file format needs
+        table = pa.concat_tables(tables).unify_dictionaries()
+    else:
+        table = _arrow_chunk(pd.DataFrame({column: pd.Series(dtype=object) for column in COLUMNS[:7]}))
+    table = table.replace_schema_metadata({'stamp': stamp})
+
+    # Written next to the target and renamed over it, so readers map whole files only
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    os.close(descriptor)
+    try:
+        with pa.OSFile(temporary, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=database.LOAD_CHUNKSIZE)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return stamp
+
+
+def open_snapshot(path):
+    """Map the snapshot at ``path`` zero-copy; returns the table and its stamp."""
+    table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+    return table, (table.schema.metadata or {}).get(b'stamp', b'').decode()
+
+
+def file_stamp(path):
+    if pa is None or not Path(path).exists():
+        return None
+    return open_snapshot(path)[1]
+
+
+def _write_in_background(db, path):
+    global _writer
+
+    def run():
+        lock = open(f"{path}.lock", 'w')
+        try:
+            if fcntl is not None:
+                # Waits while another process writes it, then maps that file
+                # instead of writing it again
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            refresh(db, path, background=False)
+        finally:
+            lock.close()
+
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=run, name='snapshot-writer', daemon=True)
+        _writer.start()
+    return _writer
+
+
+def refresh(db=None, path=None, background=True):
+    """Map the snapshot if it matches the database, else start rewriting it.
+
+    Returns True when ``table()`` serves the current data.
+    """
+    global _table, _table_stamp
+    if pa is None:
+        return False
+    path = Path(path or snapshot_path(db))
+    conn = _connect(db)
+    try:
+        stamp = data_stamp(conn)
+    finally:
+        conn.close()
+    with _lock:
+        if _table is not None and _table_stamp == stamp:
+            return True
+        _table = _table_stamp = None
+        if path.exists():
+            table, built_from = open_snapshot(path)
+            if built_from == stamp:
+                _table, _table_stamp = table, stamp
+                return True
+    if background:
+        _write_in_background(db, path)
+        return False
+    built_from = write(db, path)
+    with _lock:
+        table, _ = open_snapshot(path)
+        _table, _table_stamp = table, built_from
+    return True
+
+
+def table():
+    """The mapped snapshot last found current by ``refresh``, or None."""
+    return _table
+
+
+def table_stamp():
+    """The data stamp of the mapped snapshot, or None when none is mapped."""
+    return _table_stamp
+
+
+def load(columns=None, path=None):
+    """The snapshot as a DataFrame, reading only ``columns``; dictionary columns become categoricals."""
+    snapshot, _ = open_snapshot(path or snapshot_path())
+    return snapshot.select(list(columns or COLUMNS)).to_pandas()
+
+
+@timed('snapshot')
+def group_hours(snapshot, keys, start=ALL_TIME[0], end=ALL_TIME[1], codes=None):
+    """Total ``duration`` per ``keys`` within the Jalali window, as plain string columns.
+
+    Only ``keys``, ``date``, ``duration`` (and ``project_code`` when
+    narrowed to ``codes``) are read from the mapped file.
+    """
+    keys = list(keys)
+    columns = keys + [column for column in ['date', 'duration'] if column not in keys]
+    if codes is not None and 'project_code' not in columns:
+        columns.append('project_code')
+    selected = snapshot.select(columns)
+    conditions = []
+    if (start, end) != ALL_TIME:
+        conditions += [pc.greater_equal(selected['date'], start), pc.less_equal(selected['date'], end)]
+    elif pc.any(pc.equal(selected['date'], '')).as_py():
+        # Undated rows are outside every window, as with the SQL BETWEEN; only
+        # filtered (and copied) for all time when there are any
+        conditions.append(pc.not_equal(selected['date'], ''))
+    if codes is not None:
+        conditions.append(pc.is_in(selected['project_code'], value_set=pa.array(list(codes), pa.string())))
+    if conditions:
+        # Copies the selected columns of the matching rows
+        mask = conditions[0]
+        for condition in conditions[1:]:
+            mask = pc.and_(mask, condition)
+        selected = selected.filter(mask)
+    grouped = selected.group_by(keys).aggregate([('duration', 'sum')])
+    # Decoded through the dictionary, so each distinct name is one Python string shared by its rows
+    frame = pd.DataFrame({key: grouped[key].to_pandas().astype(object) for key in keys})
+    frame['duration'] = grouped['duration_sum'].fill_null(0).to_numpy()
+    # The pool would otherwise keep the grouping's hash tables resident
+    pa.default_memory_pool().release_unused()
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or inspect the columnar engineering snapshot")
+    parser.add_argument('command', nargs='?', default='write', choices=['write', 'status'])
+    parser.add_argument('--db', default=str(database.db_path), help="database file (default: %(default)s)")
+    parser.add_argument('--output', help="snapshot file (default: next to the database)")
+    args = parser.parse_args()
+
+    path = Path(args.output or snapshot_path(args.db))
+    # The stamp needs the change counter
+    migrate.upgrade(args.db)
+    if args.command == 'write':
+        print(f"wrote {path} ({write(args.db, path)})")
+    else:
+        conn = _connect(args.db)
+        try:
+            stamp = data_stamp(conn)
+        finally:
+            conn.close()
+        built_from = file_stamp(path)
+        print(f"database: {stamp}\nsnapshot: {built_from}\n{'current' if built_from == stamp else 'stale'}")
+
+
+if __name__ == '__main__':
+    main()
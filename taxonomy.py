@@ -0,0 +1,98 @@
+"""The project-code taxonomy: equipment, subsets, products, sources and types.
+
+The tables live in ``taxonomy.json`` (or ``ENG_VIS_TAXONOMY``) so a new
+product can be added without a redeploy. ``current()`` returns an immutable
+``Taxonomy`` and re-reads the file only when its mtime or size has changed,
+looking at most once every ``ENG_VIS_TAXONOMY_CHECK`` seconds. Callers take
+``current()`` once per batch and then do plain dict lookups.
+
+Every reload gets a new ``version`` (the file's ``version`` plus its mtime),
+which the decode and snapshot caches key on. A file that fails to parse is
+logged and the previous taxonomy stays in use.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import NamedTuple
+
+TAXONOMY_PATH = Path(os.environ.get("ENG_VIS_TAXONOMY", Path(__file__).parent / "taxonomy.json"))
+CHECK_INTERVAL = float(os.environ.get("ENG_VIS_TAXONOMY_CHECK", 5))
+
+_logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_current = None
+_stamp = None
+_checked_at = 0.0
+
+
+class Taxonomy(NamedTuple):
+    version: str
+    equipment: MappingProxyType
+    subsets: MappingProxyType
+    products: MappingProxyType
+    sources: MappingProxyType
+    types: MappingProxyType
+    # Every valid equipment + subset pair, e.g. 'D10'
+    equipment_subsets: frozenset
+
+
+def parse(data, stamp=''):
+    """Build a ``Taxonomy`` from the JSON structure; raises ValueError when it is malformed."""
+    try:
+        equipment = {key: value['name'] for key, value in data['equipment'].items()}
+        subsets = {key: MappingProxyType(dict(value.get('subsets', {}))) for key, value in data['equipment'].items()}
+        tables = [MappingProxyType(dict(data[name])) for name in ('products', 'sources', 'types')]
+    except (KeyError, TypeError, AttributeError) as exc:
+        raise ValueError(f"malformed taxonomy: {exc!r}") from exc
+    return Taxonomy(f"{data.get('version', 0)}:{stamp}", MappingProxyType(equipment), MappingProxyType(subsets),
+                    *tables, frozenset(key + subset for key, values in subsets.items() for subset in values))
+
+
+def load(path=TAXONOMY_PATH):
+    path = Path(path)
+    stat = path.stat()
+    with open(path, encoding='utf-8') as file:
+        try:
+            data = json.load(file)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"{path}: {exc}") from exc
+    return parse(data, stat.st_mtime_ns)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def current():
+    """The taxonomy in effect, reloaded when the file has changed."""
+    global _current, _stamp, _checked_at
+    now = time.monotonic()
+    if _current is not None and now - _checked_at < CHECK_INTERVAL:
+        return _current
+    with _lock:
+        _checked_at = now
+        try:
+            stamp = _file_stamp(TAXONOMY_PATH)
+            if stamp != _stamp:
+                # Recorded first so a broken file is reported once, not on every check
+                _stamp = stamp
+                _current = load(TAXONOMY_PATH)
+        except (OSError, ValueError) as exc:
+            if _current is None:
+                _stamp = None
+                raise
+            _logger.warning("could not reload %s, keeping taxonomy %s: %s", TAXONOMY_PATH, _current.version, exc)
+        return _current
+
+
+def reload():
+    """Re-read the file on the next ``current()`` call regardless of the check interval."""
+    global _stamp, _checked_at
+    with _lock:
+        _stamp = None
+        _checked_at = 0.0